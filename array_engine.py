@@ -0,0 +1,441 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from game_state import (
+    Bot,
+    FleetSnapshot,
+    GameController,
+    GameState,
+    Planet,
+    PlanetSnapshot,
+    index_incoming_fleets,
+)
+
+
+class PlanetArrays:
+    columns = ("planet_id", "x_pos", "y_pos", "player_id", "ships", "ship_growth")
+
+    def __init__(self, planets: list = ()):
+        self.planet_id = np.array([p.planet_id for p in planets], dtype=np.int64)
+        self.x_pos = np.array([p.x_pos for p in planets], dtype=np.float64)
+        self.y_pos = np.array([p.y_pos for p in planets], dtype=np.float64)
+        self.player_id = np.array([p.player_id for p in planets], dtype=np.int64)
+        self.ships = np.array([p.ships for p in planets], dtype=np.int64)
+        self.ship_growth = np.array([p.ship_growth for p in planets], dtype=np.int64)
+
+    def copy(self):
+        planets = PlanetArrays()
+        for name in self.columns:
+            setattr(planets, name, getattr(self, name).copy())
+        return planets
+
+
+class FleetArrays:
+    # Fleets are stored in launch order, with source and destination held as
+    # positions in the planet arrays rather than planet ids
+    columns = (
+        "fleet_id",
+        "player_id",
+        "ships",
+        "source",
+        "destination",
+        "total_trip_length",
+        "turns_remaining",
+    )
+    float_columns = ("total_trip_length", "turns_remaining")
+
+    def __init__(self, capacity: int = 64):
+        self.count = 0
+        for name in self.columns:
+            dtype = np.float64 if name in self.float_columns else np.int64
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def append(
+        self,
+        fleet_id: int,
+        player_id: int,
+        ships: int,
+        source: int,
+        destination: int,
+        trip_length: float,
+    ):
+        if self.count == len(self.fleet_id):
+            self.resize(max(2 * self.count, 64))
+
+        idx = self.count
+        self.fleet_id[idx] = fleet_id
+        self.player_id[idx] = player_id
+        self.ships[idx] = ships
+        self.source[idx] = source
+        self.destination[idx] = destination
+        self.total_trip_length[idx] = trip_length
+        self.turns_remaining[idx] = trip_length
+        self.count += 1
+
+    def resize(self, capacity: int):
+        for name in self.columns:
+            column = getattr(self, name)
+            resized = np.zeros(capacity, dtype=column.dtype)
+            resized[: self.count] = column[: self.count]
+            setattr(self, name, resized)
+
+    def keep(self, mask):
+        # Drops every fleet whose entry in mask is False, preserving launch order
+        kept = int(np.count_nonzero(mask))
+        for name in self.columns:
+            column = getattr(self, name)
+            column[:kept] = column[: self.count][mask]
+        self.count = kept
+
+    def copy(self):
+        fleets = FleetArrays(0)
+        for name in self.columns:
+            setattr(fleets, name, getattr(self, name)[: self.count].copy())
+        fleets.count = self.count
+        return fleets
+
+
+class StateArrays:
+    def __init__(self, planets: PlanetArrays, fleets: FleetArrays, next_fleet_id: int):
+        self.planets = planets
+        self.fleets = fleets
+        self.next_fleet_id = next_fleet_id
+        self.changed()
+
+    def changed(self):
+        self.planet_objects = None
+        self.planet_index = None
+        self.fleet_objects = None
+        self.fleet_index = None
+        self.incoming_index = None
+        self.totals = None
+
+    def copy(self):
+        return StateArrays(self.planets.copy(), self.fleets.copy(), self.next_fleet_id)
+
+    def get_planet_objects(self):
+        if self.planet_objects is None:
+            planets = []
+            for values in zip(
+                *(getattr(self.planets, name).tolist() for name in PlanetArrays.columns)
+            ):
+                planet = object.__new__(PlanetSnapshot)
+                planet.__dict__.update(zip(PlanetArrays.columns, values))
+                planets.append(planet)
+            self.planet_objects = tuple(planets)
+        return self.planet_objects
+
+    def get_planet_index(self):
+        if self.planet_index is None:
+            self.planet_index = {
+                planet.planet_id: planet for planet in self.get_planet_objects()
+            }
+        return self.planet_index
+
+    def get_fleet_objects(self):
+        if self.fleet_objects is None:
+            count = self.fleets.count
+            planet_ids = self.planets.planet_id.tolist()
+            fleets = []
+            for (
+                fleet_id,
+                player_id,
+                ships,
+                source,
+                destination,
+                total_trip_length,
+                turns_remaining,
+            ) in zip(
+                *(
+                    getattr(self.fleets, name)[:count].tolist()
+                    for name in FleetArrays.columns
+                )
+            ):
+                fleet = object.__new__(FleetSnapshot)
+                fleet.__dict__.update(
+                    ships=ships,
+                    player_id=player_id,
+                    source_planet=planet_ids[source],
+                    destination_planet=planet_ids[destination],
+                    total_trip_length=total_trip_length,
+                    turns_remaining=turns_remaining,
+                    fleet_id=fleet_id,
+                )
+                fleets.append(fleet)
+            self.fleet_objects = tuple(fleets)
+        return self.fleet_objects
+
+    def get_fleet_index(self):
+        if self.fleet_index is None:
+            self.fleet_index = {
+                fleet.fleet_id: fleet for fleet in self.get_fleet_objects()
+            }
+        return self.fleet_index
+
+    def get_incoming_index(self):
+        # (incoming fleets, incoming ships), as kept by GameState
+        if self.incoming_index is None:
+            self.incoming_index = index_incoming_fleets(self.get_fleet_objects())
+        return self.incoming_index
+
+    def get_totals(self):
+        # (planet ships, fleet ships, planet counts), each indexed by player id
+        if self.totals is None:
+            planets = self.planets
+            fleets = self.fleets
+            count = fleets.count
+            self.totals = (
+                np.bincount(planets.player_id, planets.ships, minlength=3)
+                .astype(np.int64)
+                .tolist(),
+                np.bincount(fleets.player_id[:count], fleets.ships[:count], minlength=3)
+                .astype(np.int64)
+                .tolist(),
+                np.bincount(planets.player_id, minlength=3).tolist(),
+            )
+        return self.totals
+
+
+def resolve_landings(planet_owners, planet_ships, targets, fleet_owners, fleet_ships):
+    # Fleets landing on the same planet have to be resolved in launch order,
+    # so the arrivals are split into rounds where each planet is hit at most
+    # once, and each round is resolved for every planet at the same time.
+    # targets index planet_owners/planet_ships and must be in launch order.
+    # Returns the number of times a planet changed hands
+    order = np.argsort(targets, kind="stable")
+    sorted_targets = targets[order]
+    positions = np.arange(len(order))
+    group_starts = np.ones(len(order), dtype=bool)
+    group_starts[1:] = sorted_targets[1:] != sorted_targets[:-1]
+    group_start_positions = np.maximum.accumulate(np.where(group_starts, positions, 0))
+    rounds = np.empty(len(order), dtype=np.int64)
+    rounds[order] = positions - group_start_positions
+
+    captures = 0
+    for landing_round in range(int(rounds.max()) + 1):
+        landing = rounds == landing_round
+        round_targets = targets[landing]
+        round_owners = fleet_owners[landing]
+        round_ships = fleet_ships[landing]
+
+        owners = planet_owners[round_targets]
+        ships = planet_ships[round_targets]
+        remaining_ships = np.where(
+            owners == round_owners, ships + round_ships, ships - round_ships
+        )
+        captured = remaining_ships < 0
+        planet_ships[round_targets] = np.abs(remaining_ships)
+        planet_owners[round_targets] = np.where(captured, round_owners, owners)
+        captures += int(np.count_nonzero(captured))
+    return captures
+
+
+def column_property(name: str):
+    return property(lambda self: getattr(self.planets, name)[self.position].item())
+
+
+class PlanetView(Planet):
+    # Live, read-only view of one row of the engine's planet arrays
+    def __init__(self, planets: PlanetArrays, position: int):
+        self.planets = planets
+        self.position = position
+
+    planet_id = column_property("planet_id")
+    x_pos = column_property("x_pos")
+    y_pos = column_property("y_pos")
+    player_id = column_property("player_id")
+    ships = column_property("ships")
+    ship_growth = column_property("ship_growth")
+
+
+class ArrayGameState(GameState):
+    # GameState reader API over StateArrays, with planet and fleet objects only
+    # built when a reader actually asks for them
+    def __init__(self, arrays: StateArrays, loaded_state: GameState):
+        self.arrays = arrays
+        self.planet_positions = loaded_state.planet_positions
+        self.trip_lengths = loaded_state.trip_lengths
+        self.current_player = None
+        self.enemy_player = None
+        # Lists of the state's own, as GameController.copy_game_state gives
+        # bots, so a bot can sort them without changing the other bot's
+        self.planet_list = None
+        self.fleet_list = None
+
+    @property
+    def planets(self):
+        if self.planet_list is None:
+            self.planet_list = list(self.arrays.get_planet_objects())
+        return self.planet_list
+
+    @property
+    def planet_index(self):
+        return self.arrays.get_planet_index()
+
+    @property
+    def fleets(self):
+        if self.fleet_list is None:
+            self.fleet_list = list(self.arrays.get_fleet_objects())
+        return self.fleet_list
+
+    @property
+    def fleet_index(self):
+        return self.arrays.get_fleet_index()
+
+    @property
+    def incoming_fleets(self):
+        return self.arrays.get_incoming_index()[0]
+
+    @property
+    def incoming_ships(self):
+        return self.arrays.get_incoming_index()[1]
+
+    @property
+    def next_fleet_id(self):
+        return self.arrays.next_fleet_id
+
+    @property
+    def planet_ships(self):
+        return self.arrays.get_totals()[0]
+
+    @property
+    def fleet_ships(self):
+        return self.arrays.get_totals()[1]
+
+    @property
+    def planet_counts(self):
+        return self.arrays.get_totals()[2]
+
+
+class LiveArrayGameState(ArrayGameState):
+    # The engine's own state, whose planets are live views over the arrays
+    def __init__(self, arrays: StateArrays, loaded_state: GameState):
+        super().__init__(arrays, loaded_state)
+        self.planet_views = tuple(
+            PlanetView(arrays.planets, position)
+            for position in range(len(loaded_state.planets))
+        )
+        self.planet_view_index = {
+            planet.planet_id: planet for planet in self.planet_views
+        }
+
+    @property
+    def planets(self):
+        return self.planet_views
+
+    @property
+    def planet_index(self):
+        return self.planet_view_index
+
+    @property
+    def fleets(self):
+        return self.arrays.get_fleet_objects()
+
+
+class ArrayGameController(GameController):
+    # Drop-in replacement for GameController that keeps planets and fleets in
+    # parallel NumPy arrays and advances fleets and growth with array operations
+    def __init__(self, map_store=None, time_budget=None, isolate_bots=False):
+        if np is None:
+            raise ImportError("ArrayGameController requires numpy")
+        super().__init__(map_store, time_budget, isolate_bots)
+        self.arrays = None
+        self.frame = None
+
+    def start_game(self, bot_1: Bot, bot_2: Bot):
+        super().start_game(bot_1, bot_2)
+        self.arrays = None
+        self.frame = None
+
+    def load_map(self, map_name: str, planets: list):
+        super().load_map(map_name, planets)
+        loaded_state = self.game_state
+        self.arrays = StateArrays(
+            PlanetArrays(loaded_state.planets),
+            FleetArrays(),
+            loaded_state.next_fleet_id,
+        )
+        self.game_state = LiveArrayGameState(self.arrays, loaded_state)
+        self.frame = None
+
+    def changed(self):
+        self.arrays.changed()
+        self.frame = None
+
+    def copy_game_state(self, current_player: int):
+        # Both bots share one copy of the arrays taken at the start of the turn
+        if self.frame is None:
+            self.frame = self.arrays.copy()
+        state = ArrayGameState(self.frame, self.game_state)
+        state.current_player = current_player
+        state.enemy_player = 2 if current_player == 1 else 1
+        return state
+
+    def launch_fleet(
+        self, source_planet: Planet, destination_planet: Planet, ships: int
+    ):
+        if ships <= 0:
+            raise ValueError("Can only launch a positive number of ships")
+
+        if source_planet.ships - ships < 0:
+            raise ValueError(
+                f"Player {source_planet.player_id} tried to launch {ships} ships from {source_planet} "
+                f"(has only {source_planet.ships} ships)"
+            )
+
+        planets = self.arrays.planets
+        source = source_planet.position
+        destination = destination_planet.position
+        planets.ships[source] -= ships
+        self.arrays.fleets.append(
+            self.arrays.next_fleet_id,
+            planets.player_id[source],
+            ships,
+            source,
+            destination,
+            self.game_state.get_trip_length(
+                source_planet.planet_id, destination_planet.planet_id
+            ),
+        )
+        self.arrays.next_fleet_id += 1
+        self.changed()
+
+    def move_fleets(self):
+        fleets = self.arrays.fleets
+        if not fleets.count:
+            return
+
+        turns_remaining = fleets.turns_remaining[: fleets.count]
+        turns_remaining -= 1
+        arrived = turns_remaining <= 0
+        if arrived.any():
+            if self.metrics is not None:
+                self.metrics.start_section("fleet landings")
+            self.land_fleets(np.flatnonzero(arrived))
+            fleets.keep(~arrived)
+            if self.metrics is not None:
+                self.metrics.end_section()
+        self.changed()
+
+    def land_fleets(self, arrivals):
+        fleets = self.arrays.fleets
+        planets = self.arrays.planets
+        captures = resolve_landings(
+            planets.player_id,
+            planets.ships,
+            fleets.destination[arrivals],
+            fleets.player_id[arrivals],
+            fleets.ships[arrivals],
+        )
+        if self.metrics is not None:
+            # Captures are resolved together with the landings, so their time
+            # is part of the "fleet landings" section
+            self.metrics.count("fleet landings", len(arrivals))
+            self.metrics.count("planet captures", captures)
+
+    def grow_planets(self):
+        planets = self.arrays.planets
+        planets.ships += planets.ship_growth * (planets.player_id != 0)
+        self.changed()
@@ -1,12 +1,16 @@
-from multiprocessing import Pool
 import os
 from os import path
-from time import time
+import threading
+from time import perf_counter, time
 
 from tkinter import *
+from tkinter import filedialog
 import tkinter.ttk as ttk
 
 from game_state import *
+from replay import Replay, ReplayPlayer
+from result_cache import ResultCache
+from tournament import get_jobs, get_round_robin_pairs, run_tournament, summarise
 
 
 class SimulationCanvas(Frame):
@@ -20,6 +24,7 @@ class SimulationCanvas(Frame):
         self.y_scale_factor = self.canvas_height / self.max_y
 
         self.controller = None
+        self.replay_player = None
         self.simulation_canvas = Canvas(
             self, background="black", width=self.canvas_width, height=self.canvas_height
         )
@@ -28,6 +33,10 @@ class SimulationCanvas(Frame):
         self.planet_shapes = {}
         self.planet_labels = {}
         self.fleets = {}
+        # What is currently drawn, so that only items that changed are updated
+        self.planet_coords = {}
+        self.drawn_planets = {}
+        self.drawn_fleet_positions = {}
 
     def initialise(self, controller: GameController):
         self.controller = controller
@@ -35,9 +44,15 @@ class SimulationCanvas(Frame):
 
         self.planet_shapes = {}
         self.planet_labels = {}
+        self.fleets = {}
+        self.replay_player = None
+        self.planet_coords = {}
+        self.drawn_planets = {}
+        self.drawn_fleet_positions = {}
 
         for planet in controller.game_state.get_planets():
             x_pos, y_pos = self.map_to_canvas_coord(planet.x_pos, planet.y_pos)
+            self.planet_coords[planet.planet_id] = x_pos, y_pos
             size = (planet.ship_growth + 3) * 3.5
             shape = self.simulation_canvas.create_oval(
                 (x_pos, y_pos, x_pos + size, y_pos + size)
@@ -49,6 +64,17 @@ class SimulationCanvas(Frame):
             )
             self.planet_labels[planet.planet_id] = label
 
+    def load_replay(self, replay: Replay):
+        replay_player = ReplayPlayer(replay)
+        self.initialise(replay_player.controller)
+        self.replay_player = replay_player
+        self.update_canvas()
+
+    def seek(self, turn: int):
+        # Jumps the loaded replay to the given turn without calling the bots
+        self.replay_player.seek(turn)
+        self.update_canvas()
+
     @staticmethod
     def get_player_color(player_id: int):
         return {0: "blue", 1: "red", 2: "green"}[player_id]
@@ -61,63 +87,145 @@ class SimulationCanvas(Frame):
 
     def get_fleet_position(self, fleet: Fleet):
 
-        source_planet = self.controller.game_state.get_planet(fleet.source_planet)
-        destination_planet = self.controller.game_state.get_planet(
-            fleet.destination_planet
-        )
-
-        start_x, start_y = self.map_to_canvas_coord(
-            source_planet.x_pos, source_planet.y_pos
-        )
-        end_x, end_y = self.map_to_canvas_coord(
-            destination_planet.x_pos, destination_planet.y_pos
-        )
+        start_x, start_y = self.planet_coords[fleet.source_planet]
+        end_x, end_y = self.planet_coords[fleet.destination_planet]
 
         travel_delta = fleet.get_turns_travelled() / fleet.total_trip_length
 
+        # Whole pixels, so fleets that haven't visibly moved aren't redrawn
         return (
-            start_x + (end_x - start_x) * travel_delta,
-            start_y + (end_y - start_y) * travel_delta,
+            round(start_x + (end_x - start_x) * travel_delta),
+            round(start_y + (end_y - start_y) * travel_delta),
         )
 
-    def update_canvas(self):
-
-        for planet_id, oval_id in self.planet_shapes.items():
-            planet = self.controller.game_state.get_planet(planet_id)
-            color = self.get_player_color(planet.player_id)
-            self.simulation_canvas.itemconfig(oval_id, fill=color)
-
-        for planet_id, label_id in self.planet_labels.items():
-            planet = self.controller.game_state.get_planet(planet_id)
-            self.simulation_canvas.itemconfig(label_id, text=str(planet.ships))
-
-        # Remove fleets that have landed
-        for fleet_id in list(self.fleets.keys()):
-            if not self.controller.game_state.get_fleet(fleet_id):
-                label_id = self.fleets[fleet_id]
-                self.simulation_canvas.delete(label_id)
-                del self.fleets[fleet_id]
-
-        # Add fleets that have launched
-        for fleet in self.controller.game_state.get_fleets():
-            if fleet.fleet_id not in self.fleets:
-                label_id = self.simulation_canvas.create_text(
-                    0,
-                    0,
+    def update_canvas(self, game_state: GameState = None):
+        # Draws game_state, which defaults to the controller's own state
+        canvas = self.simulation_canvas
+        if game_state is None:
+            game_state = self.controller.game_state
+
+        for planet in game_state.get_planets():
+            drawn = self.drawn_planets.get(planet.planet_id)
+            if drawn is None or drawn[0] != planet.player_id:
+                canvas.itemconfig(
+                    self.planet_shapes[planet.planet_id],
+                    fill=self.get_player_color(planet.player_id),
+                )
+            if drawn is None or drawn[1] != planet.ships:
+                canvas.itemconfig(
+                    self.planet_labels[planet.planet_id], text=str(planet.ships)
+                )
+            self.drawn_planets[planet.planet_id] = planet.player_id, planet.ships
+
+        fleets = self.fleets
+        positions = self.drawn_fleet_positions
+        fleet_ids = set()
+        for fleet in game_state.get_fleets():
+            fleet_id = fleet.fleet_id
+            fleet_ids.add(fleet_id)
+            position = self.get_fleet_position(fleet)
+
+            # Add fleets that have launched
+            label_id = fleets.get(fleet_id)
+            if label_id is None:
+                fleets[fleet_id] = canvas.create_text(
+                    *position,
                     fill=self.get_player_color(fleet.player_id),
                     anchor="center",
                     text=str(fleet.ships),
                 )
-                self.fleets[fleet.fleet_id] = label_id
+            elif positions[fleet_id] != position:
+                canvas.coords(label_id, *position)
+            positions[fleet_id] = position
 
-        # Update position of all fleets
-        for fleet_id, label_id in self.fleets.items():
-            fleet = self.controller.game_state.get_fleet(fleet_id)
-            x_pos, y_pos = self.get_fleet_position(fleet)
-            self.simulation_canvas.coords(label_id, x_pos, y_pos)
+        # Remove fleets that have landed, all in one call
+        landed_fleet_ids = [
+            fleet_id for fleet_id in fleets if fleet_id not in fleet_ids
+        ]
+        if landed_fleet_ids:
+            canvas.delete(*(fleets.pop(fleet_id) for fleet_id in landed_fleet_ids))
+            for fleet_id in landed_fleet_ids:
+                del positions[fleet_id]
+
+
+class GameRunner(threading.Thread):
+    # Plays a game on a background thread so slow bots can't freeze the GUI.
+    # After a turn, a read-only (game_state, result) snapshot is put in a
+    # single slot, but only once the GUI has taken the last one (or the game
+    # is over), so no snapshots are made of turns that would never be drawn.
+    # turns_per_second can be changed while it runs, and None plays as fast
+    # as possible
+    def __init__(self, controller: GameController, turns_per_second: float = None):
+        threading.Thread.__init__(self, daemon=True)
+        self.controller = controller
+        self.turns_per_second = turns_per_second
+        self.latest = None
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.cancelled = threading.Event()
+        self.error = None
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def take_latest(self):
+        # The snapshot not drawn yet, or None, leaving the slot empty
+        with self.lock:
+            latest, self.latest = self.latest, None
+        return latest
+
+    def get_frame_state(self):
+        # Fleets are copied with their turns_remaining at this turn, as the
+        # shared fleet snapshots work it out from the latest state handed out
+        state = self.controller.copy_game_state(1)
+        state.fleets = [FleetSnapshot.of(fleet) for fleet in state.fleets]
+        return state
+
+    def run(self):
+        next_turn_time = perf_counter()
+        while True:
+            self.running.wait()
+            if self.cancelled.is_set():
+                return
+
+            try:
+                self.controller.turn_step()
+                result = self.controller.get_game_result()
+            except Exception as e:
+                self.error = e
+                raise
+            if result or self.latest is None:
+                state = self.get_frame_state()
+                with self.lock:
+                    self.latest = state, result
+            if result:
+                return
+
+            turns_per_second = self.turns_per_second
+            if turns_per_second:
+                next_turn_time += 1 / turns_per_second
+                delay = next_turn_time - perf_counter()
+                if delay > 0:
+                    self.cancelled.wait(delay)
+                else:
+                    # Running behind, so carry on from now rather than rushing
+                    next_turn_time = perf_counter()
+            else:
+                next_turn_time = perf_counter()
 
 
 class AutopylotFrame(Frame):
+    # 1x is the original speed of one turn per frame at 12 frames a second
+    speeds = {"1x": 12, "2x": 24, "4x": 48, "10x": 120, "Max": None}
+    frame_interval = int(1000 / 30)
+
     def __init__(self, master=None):
         Frame.__init__(self, master)
         self.map_files = self.get_map_files("maps")
@@ -125,6 +233,7 @@ class AutopylotFrame(Frame):
         self.bots = self.load_bots()
 
         self.controller = GameController()
+        self.runner = None
         self.is_game_running = False
 
         self.main_frame = ttk.Frame(self)
@@ -194,6 +303,35 @@ class AutopylotFrame(Frame):
         )
         self.autoplay_button.pack(side=LEFT)
 
+        self.replay_button = ttk.Button(
+            buttons_frame, text="Load Replay", command=self.load_replay
+        )
+        self.replay_button.pack(side=LEFT)
+
+        self.speed = StringVar(value="1x")
+        ttk.Label(buttons_frame, text="Speed").pack(side=LEFT)
+        speed_box = ttk.Combobox(
+            buttons_frame,
+            textvariable=self.speed,
+            values=list(self.speeds),
+            state="readonly",
+            width=5,
+        )
+        speed_box.bind("<<ComboboxSelected>>", self.change_speed)
+        speed_box.pack(side=LEFT)
+
+        self.turn_scale = Scale(
+            self.main_frame,
+            orient=HORIZONTAL,
+            label="Turn",
+            from_=0,
+            to=0,
+            length=512,
+            command=self.seek_replay,
+        )
+        self.turn_scale.config(state=DISABLED)
+        self.turn_scale.grid(column=1, row=5, columnspan=3)
+
         self.message_box = Text(self.main_frame)
         self.message_box.config(state=DISABLED)
         self.message_box.grid(column=4, row=1, rowspan=4)
@@ -258,16 +396,28 @@ class AutopylotFrame(Frame):
         bot_2 = self.bots[bot_2_index[0]]
         map_name = self.map_files[map_index[0]]
 
+        if self.runner:
+            self.runner.cancel()
+
+        # A new controller each game, as a cancelled runner may still be
+        # finishing a turn with the old one
+        self.controller = GameController()
         self.controller.start_game(bot_1, bot_2)
 
         self.controller.load_map_file("maps/" + map_name)
         self.game_frame.initialise(self.controller)
+        self.game_frame.update_canvas()
+        self.turn_scale.config(state=DISABLED)
+
+        self.runner = GameRunner(self.controller, self.speeds[self.speed.get()])
+        self.runner.start()
 
         self.stop_button.config(state=NORMAL)
         self.start_button.config(state=DISABLED)
         self.resume_button.config(state=DISABLED)
         self.is_game_running = True
 
+        self.runner.resume()
         self.update_game()
 
     def stop_game(self):
@@ -275,6 +425,8 @@ class AutopylotFrame(Frame):
         self.resume_button.config(state=NORMAL)
         self.start_button.config(state=NORMAL)
         self.is_game_running = False
+        if self.runner:
+            self.runner.pause()
 
     def resume_game(self):
         if self.is_game_running:
@@ -285,22 +437,70 @@ class AutopylotFrame(Frame):
         self.start_button.config(state=DISABLED)
 
         self.is_game_running = True
+        self.runner.resume()
         self.update_game()
 
+    def change_speed(self, event=None):
+        if self.runner:
+            self.runner.turns_per_second = self.speeds[self.speed.get()]
+
     def update_game(self):
         if not self.is_game_running:
             return
 
-        self.controller.turn_step()
-        self.game_frame.update_canvas()
+        # Checked before the slot is taken, so a runner that stopped has put
+        # its last state there by now, even its final result
+        runner_stopped = not self.runner.is_alive()
 
-        result = self.controller.get_game_result()
-        if result:
-            self.add_message(str(result))
+        # Only the latest state is drawn, the turns since the last frame are skipped
+        latest = self.runner.take_latest()
+
+        if latest:
+            game_state, result = latest
+            self.game_frame.update_canvas(game_state)
+            if result:
+                self.add_message(str(result))
+                self.stop_game()
+                self.resume_button.config(state=DISABLED)
+                return
+
+        if runner_stopped:
+            self.add_message(f"The game stopped: {self.runner.error!r}")
             self.stop_game()
+            self.resume_button.config(state=DISABLED)
+            return
+
+        self.after(self.frame_interval, self.update_game)
+
+    def load_replay(self):
+        if self.is_game_running:
             return
 
-        self.after(int(1000 / 12), self.update_game)
+        replay_file = filedialog.askopenfilename(
+            filetypes=[("AutoPylot replays", "*.replay"), ("All files", "*")]
+        )
+        if not replay_file:
+            return
+
+        try:
+            replay = Replay.load(replay_file)
+        except (OSError, ValueError) as e:
+            self.add_message(f"Could not load {replay_file}: {e}")
+            return
+
+        self.game_frame.load_replay(replay)
+        self.resume_button.config(state=DISABLED)
+        self.turn_scale.config(state=NORMAL, to=replay.turns)
+        self.turn_scale.set(0)
+        self.add_message(
+            f"Replay of {replay.bot_1_name} against {replay.bot_2_name} "
+            f"on {replay.map_name} ({replay.turns} turns)"
+        )
+
+    def seek_replay(self, turn: str):
+        if self.game_frame.replay_player is None or self.is_game_running:
+            return
+        self.game_frame.seek(int(turn))
 
     def add_message(self, message: str):
         self.message_box.configure(state=NORMAL)
@@ -313,50 +513,18 @@ class AutopylotFrame(Frame):
             return
 
         # Get all combinations of every bot against every other bot
-        pairs = [
-            (x, y)
-            for x_idx, x in enumerate(self.bots)
-            for y_idx, y in enumerate(self.bots)
-            if x_idx < y_idx
-        ]
-        pair_maps = [
-            (bot_1, bot_2, map_file)
-            for bot_1, bot_2 in pairs
-            for map_file in self.map_files
-        ]
-        pool = Pool(processes=8)
-        results = pool.map(autoplay_map, pair_maps)
+        pairs = get_round_robin_pairs(self.bots)
+        pair_maps = get_jobs(pairs, self.map_files)
 
-        for result in results:
+        results = []
+        result_cache = ResultCache("results.cache")
+        for result in run_tournament(pair_maps, seed=0, result_cache=result_cache):
+            results.append(result)
             self.add_message(str(result))
+            self.update_idletasks()
 
-        for bot in self.bots:
-            win_count = sum(
-                [result.get_winning_bot().name == bot.name for result in results]
-            )
-            lose_count = sum(
-                [result.get_losing_bot().name == bot.name for result in results]
-            )
-            draw_count = sum([result.winning_player == 0 for result in results])
-            self.add_message(
-                f"{bot.name} won {win_count} games and lost {lose_count} games (drew {draw_count} games)"
-            )
-
-
-def autoplay_map(args):
-    bot_1 = args[0]
-    bot_2 = args[1]
-    map_file = args[2]
-    controller = GameController()
-    controller.start_game(bot_1, bot_2)
-
-    controller.load_map_file("maps/" + map_file)
-
-    while True:
-        controller.turn_step()
-        result = controller.get_game_result()
-        if result:
-            return result
+        for message in summarise(results, self.bots):
+            self.add_message(message)
 
 
 if __name__ == "__main__":
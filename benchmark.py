@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+from time import perf_counter
+import tracemalloc
+
+from game_state import Bot, GameController
+from instrumentation import Metrics
+from map_store import MapStore
+from result_cache import get_game_seed
+from tournament import engines, filter_names
+
+# Fixed so every run plays exactly the same games
+bot_pairs = (
+    ("turtle_bot.py", "random_bot.py"),
+    ("uni_bot.py", "random_bot.py"),
+    ("uni_bot.py", "turtle_bot.py"),
+)
+default_maps = [f"map{number}.txt" for number in range(1, 6)]
+seed = 0
+
+phases = (
+    "snapshot copy",
+    "get_commands",
+    "command validation",
+    "fleet launches",
+    "fleet moves",
+    "fleet landings",
+    "planet captures",
+    "growth",
+    "result check",
+)
+
+
+def play_game(
+    controller_class,
+    map_store: MapStore,
+    bot_1: Bot,
+    bot_2: Bot,
+    map_file: str,
+    metrics: Metrics = None,
+):
+    random.seed(get_game_seed(seed, bot_1, bot_2, map_file))
+    controller = controller_class(map_store)
+    controller.metrics = metrics
+    # Rejected commands are only counted, so they don't bury the report
+    controller.command_errors.report_limit = 0
+    controller.start_game(bot_1, bot_2)
+    controller.load_map_file("maps/" + map_file)
+    while True:
+        controller.turn_step()
+        if metrics is not None:
+            start_time = perf_counter()
+        result = controller.get_game_result()
+        if metrics is not None:
+            metrics.lap("result check", start_time)
+        if result:
+            return result
+
+
+def run_case(controller_class, map_store: MapStore, bots: tuple, map_files: list):
+    # Plays one bot pair on every map, returning the seconds taken, the turn
+    # count of every game and the seconds spent in each phase
+    metrics = Metrics()
+    turns = []
+    start_time = perf_counter()
+    for map_file in map_files:
+        result = play_game(controller_class, map_store, *bots, map_file, metrics)
+        turns.append(result.turn)
+    seconds = perf_counter() - start_time
+
+    phase_times = dict.fromkeys(phases, 0.0)
+    for (phase, bot), (calls, phase_seconds) in metrics.timers.items():
+        phase_times[phase] += phase_seconds
+    return seconds, turns, phase_times
+
+
+def get_peak_memory(controller_class, map_store: MapStore, bots: tuple, map_files):
+    # Peak bytes allocated while playing the games, measured in a separate
+    # untimed run because tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        for map_file in map_files:
+            play_game(controller_class, map_store, *bots, map_file)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(engine_names: list, map_files: list, repeat: int = 3):
+    # Yields (name, results) for every engine and bot pair
+    map_store = MapStore.from_files("maps")
+    for engine_name in engine_names:
+        controller_class = engines[engine_name]
+        for bot_files in bot_pairs:
+            bots = tuple(Bot(bot_file) for bot_file in bot_files)
+            # The fastest run is the one least disturbed by the rest of the
+            # machine
+            seconds, turns, phase_times = min(
+                (
+                    run_case(controller_class, map_store, bots, map_files)
+                    for _ in range(repeat)
+                ),
+                key=lambda run: run[0],
+            )
+            peak_memory = get_peak_memory(controller_class, map_store, bots, map_files)
+            name = f"{engine_name} {bots[0].name}-{bots[1].name}"
+            yield name, {
+                "games": len(map_files),
+                "turns": turns,
+                "seconds": seconds,
+                "turns_per_second": sum(turns) / seconds,
+                "games_per_second": len(map_files) / seconds,
+                "peak_memory": peak_memory,
+                "phases": phase_times,
+            }
+
+
+def format_case(name: str, case: dict):
+    other_seconds = case["seconds"] - sum(case["phases"].values())
+    phase_text = ", ".join(
+        f"{phase} {seconds / case['seconds']:.0%}"
+        for phase, seconds in (*case["phases"].items(), ("other", other_seconds))
+    )
+    return (
+        f"{name}: {case['turns_per_second']:.0f} turns/s "
+        f"{case['games_per_second']:.1f} games/s "
+        f"peak memory {case['peak_memory'] / 1024:.0f} KiB\n"
+        f"  {phase_text}"
+    )
+
+
+def compare(cases: dict, baseline: dict, threshold: float):
+    # Returns a line for every case that got slower or bigger by more than
+    # threshold (a fraction) compared to baseline
+    regressions = []
+    for name, case in cases.items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+
+        if base["turns"] != case["turns"]:
+            print(f"{name}: games played differently from the baseline")
+        if case["turns_per_second"] < base["turns_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {case['turns_per_second']:.0f} turns/s, "
+                f"down from {base['turns_per_second']:.0f}"
+            )
+        if case["peak_memory"] > base["peak_memory"] * (1 + threshold):
+            regressions.append(
+                f"{name}: peak memory {case['peak_memory'] / 1024:.0f} KiB, "
+                f"up from {base['peak_memory'] / 1024:.0f}"
+            )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure how fast the AutoPylot engine plays a fixed set of games"
+    )
+    parser.add_argument(
+        "--engine",
+        nargs="+",
+        choices=sorted(engines),
+        default=["objects"],
+        help="simulation backends to measure (default: objects)",
+    )
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        metavar="MAP",
+        help="map names or glob patterns to play on (default: map1 to map5)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="times each case is played, keeping the fastest (default: 3)",
+    )
+    parser.add_argument(
+        "--save",
+        metavar="FILE",
+        help="save the results to this JSON file as a baseline",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        help="fail if any case is slower or uses more memory than this baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction a case may regress by before --compare fails (default: 0.1)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.maps:
+        map_files = filter_names(sorted(os.listdir("maps")), args.maps, ".txt")
+    else:
+        map_files = default_maps
+    if not map_files:
+        sys.exit("No maps to play (check the --maps filter)")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    cases = {}
+    for name, case in run_benchmarks(args.engine, map_files, args.repeat):
+        cases[name] = case
+        print(format_case(name, case), flush=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "engine_version": GameController.engine_version,
+                    "maps": map_files,
+                    "cases": cases,
+                },
+                f,
+                indent=2,
+            )
+
+    if baseline is not None:
+        regressions = compare(cases, baseline, args.threshold)
+        if regressions:
+            sys.exit("Regressions:\n" + "\n".join(regressions))
+        print(f"No regressions past {args.threshold:.0%} of {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
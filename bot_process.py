@@ -0,0 +1,131 @@
+import multiprocessing
+import random
+from time import perf_counter
+import traceback
+
+
+class BotProcessError(Exception):
+    pass
+
+
+def run_bot(module_name: str, connection, seed: int):
+    # Imported here because game_state imports this module
+    from game_state import load_bot_module
+    from state_delta import GameStateMirror
+
+    random.seed(seed)
+    get_commands = load_bot_module(module_name).get_commands
+    mirror = GameStateMirror()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+
+        if message[0] == "stop":
+            return
+        state = mirror.apply(message)
+        if state is None:
+            continue
+
+        turn = message[1]
+        start_time = perf_counter()
+        try:
+            commands = get_commands(state)
+            elapsed = perf_counter() - start_time
+            connection.send(("commands", turn, commands, elapsed))
+        except Exception:
+            # Includes commands that can't be sent back, e.g. a lambda
+            elapsed = perf_counter() - start_time
+            connection.send(("error", turn, traceback.format_exc(), elapsed))
+
+
+class BotProcess:
+    # Runs one bot's get_commands in its own process for a whole game, so the
+    # bot can't crash the engine and both bots can think at the same time.
+    # The bot's random module is seeded with seed, as it doesn't share the
+    # engine's
+    def __init__(self, module_name: str, seed: int):
+        from state_delta import StateDeltaEncoder
+
+        self.module_name = module_name
+        self.connection, bot_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=run_bot,
+            args=(module_name, bot_connection, seed),
+            name=f"bot-{module_name}",
+            daemon=True,
+        )
+        self.process.start()
+        bot_connection.close()
+        # Each turn only what changed since the last turn the bot was sent
+        self.encoder = StateDeltaEncoder()
+        self.sent_time = None
+        # Turn the bot is still working on, if it hasn't answered it yet
+        self.pending_turn = None
+
+    def is_busy(self):
+        # Whether the bot is still thinking about a turn it ran out of time on,
+        # in which case it isn't sent another one until it has answered
+        if self.pending_turn is None:
+            return False
+        try:
+            if not self.connection.poll(0):
+                return True
+            self.connection.recv()
+        except (EOFError, OSError) as e:
+            self.process.join(0.5)
+            raise BotProcessError(
+                f"bot process for {self.module_name} stopped "
+                f"(exit code {self.process.exitcode})"
+            ) from e
+        self.pending_turn = None
+        return False
+
+    def send_turn(self, turn: int, game_state):
+        try:
+            for message in self.encoder.encode(turn, game_state):
+                self.connection.send(message)
+        except OSError as e:
+            raise BotProcessError(f"bot process for {self.module_name} stopped") from e
+        self.sent_time = perf_counter()
+        self.pending_turn = turn
+
+    def receive(self, timeout: float = None):
+        # Returns (commands, seconds the bot took, whether it ran out of time,
+        # the traceback of the exception the bot raised or None) for the turn
+        # that was last sent
+        if timeout is None:
+            remaining = None
+        else:
+            # An answer that is already waiting still counts, even if this
+            # bot's deadline passed while the other bot was waited on
+            remaining = max(self.sent_time + timeout - perf_counter(), 0)
+
+        try:
+            if not self.connection.poll(remaining):
+                return None, perf_counter() - self.sent_time, True, None
+            kind, turn, payload, elapsed = self.connection.recv()
+        except (EOFError, OSError) as e:
+            self.process.join(0.5)
+            raise BotProcessError(
+                f"bot process for {self.module_name} stopped "
+                f"(exit code {self.process.exitcode})"
+            ) from e
+
+        self.pending_turn = None
+        if kind == "error":
+            return None, elapsed, False, payload
+        return payload, elapsed, False, None
+
+    def close(self):
+        try:
+            self.connection.send(("stop",))
+        except OSError:
+            pass
+        self.connection.close()
+        self.process.join(0.5)
+        if self.process.is_alive():
+            # Still thinking about a turn it ran out of time on
+            self.process.terminate()
+            self.process.join()
@@ -0,0 +1,129 @@
+import math
+import signal
+import threading
+
+
+class BotTimeout(BaseException):
+    # A BaseException so that a bot's own "except Exception" can't swallow it
+    pass
+
+
+class TimeBudget:
+    # How long each bot may think per turn and per game, and what happens when
+    # it overruns:
+    #  - skip: the bot is interrupted and its commands for that turn are dropped
+    #    (and once the game budget is spent it isn't called again)
+    #  - forfeit: the bot is interrupted and loses the game
+    #  - warn: the bot is never interrupted, overruns are only counted
+    policies = ("skip", "forfeit", "warn")
+
+    def __init__(
+        self, turn_seconds: float = None, game_seconds: float = None, policy="skip"
+    ):
+        if policy not in self.policies:
+            raise ValueError(
+                f"Unknown overrun policy {policy} (expected one of {', '.join(self.policies)})"
+            )
+
+        self.turn_seconds = turn_seconds
+        self.game_seconds = game_seconds
+        self.policy = policy
+
+    def get_deadline(self, time_used: float):
+        # Seconds the bot may take this turn, or None if it has no limit
+        limits = []
+        if self.turn_seconds is not None:
+            limits.append(self.turn_seconds)
+        if self.game_seconds is not None:
+            limits.append(self.game_seconds - time_used)
+        return min(limits) if limits else None
+
+
+class LatencyHistogram:
+    # Log-scale histogram of per-turn thinking times, 10 buckets per decade
+    # from 1us up to 100s, which is small to send back from pool workers and
+    # can be merged across games
+    min_seconds = 1e-6
+    buckets_per_decade = 10
+    bucket_count = 80
+
+    def __init__(self):
+        self.counts = [0] * (self.bucket_count + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        if seconds <= self.min_seconds:
+            bucket = 0
+        else:
+            bucket = min(
+                int(math.log10(seconds / self.min_seconds) * self.buckets_per_decade)
+                + 1,
+                self.bucket_count,
+            )
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def get_percentile(self, percentile: float):
+        # Upper bound of the bucket holding the given percentile
+        if not self.count:
+            return 0.0
+
+        rank = math.ceil(self.count * percentile / 100)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                upper_bound = self.min_seconds * 10 ** (
+                    bucket / self.buckets_per_decade
+                )
+                return min(upper_bound, self.max)
+        return self.max
+
+    def __str__(self):
+        return (
+            f"p50 {self.get_percentile(50) * 1000:.2f}ms "
+            f"p95 {self.get_percentile(95) * 1000:.2f}ms "
+            f"max {self.max * 1000:.2f}ms "
+            f"total {self.total:.2f}s over {self.count} turns"
+        )
+
+
+def raise_timeout(signum, frame):
+    raise BotTimeout()
+
+
+def can_interrupt():
+    return (
+        hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+    )
+
+
+def call_with_deadline(function, argument, seconds: float):
+    # Calls function(argument), raising BotTimeout if it is still running after
+    # the given number of seconds. Interrupting relies on SIGALRM, so on
+    # platforms or threads without it the call simply runs to completion
+    if seconds is None or not can_interrupt():
+        return function(argument)
+
+    if seconds <= 0:
+        raise BotTimeout()
+
+    previous_handler = signal.signal(signal.SIGALRM, raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return function(argument)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
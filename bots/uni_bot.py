@@ -6,20 +6,8 @@ import random
 def get_planet_plus_fleets(game_state: GameState, planet_id: int):
     return (
         game_state.get_planet(planet_id).ships
-        + sum(
-            [
-                fleet.ships
-                for fleet in game_state.get_enemy_fleets()
-                if fleet.destination_planet == planet_id
-            ]
-        )
-        - sum(
-            [
-                fleet.ships
-                for fleet in game_state.get_my_fleets()
-                if fleet.destination_planet == planet_id
-            ]
-        )
+        + game_state.get_incoming_ships(planet_id, game_state.enemy_player)
+        - game_state.get_incoming_ships(planet_id, game_state.current_player)
     )
 
 
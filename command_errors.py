@@ -0,0 +1,113 @@
+from collections import deque
+import sys
+
+messages = {
+    "not_a_command": "returned an object that was not a FleetCommand",
+    "unknown_source": "tried to launch {ships} ships from unknown planet {source}",
+    "invalid_ships": 'tried to send an invalid number of ships "{ships}" '
+    "from planet {source} to {destination}",
+    "too_many_ships": "tried to launch too many ships {ships} from planet {source} "
+    "(it has only {available} ships)",
+    "unknown_destination": "tried to launch {ships} ships from planet {source} "
+    "to an unknown planet {destination}",
+    "not_owned": "tried to launch {ships} ships from planet {source} "
+    "which it doesn't own",
+    "same_planet": "tried to send {ships} ships to/from planet {source}",
+}
+
+bot_messages = {
+    "exception": "raised an exception:\n{details}",
+    "process_stopped": "forfeited as its {details}",
+}
+
+
+class CommandError:
+    # One rejected command. Only turned into text when someone asks for it
+    def __init__(
+        self,
+        turn: int,
+        player_id: int,
+        reason: str,
+        source=None,
+        destination=None,
+        ships=None,
+        available=None,
+    ):
+        self.turn = turn
+        self.player_id = player_id
+        self.reason = reason
+        self.source = source
+        self.destination = destination
+        self.ships = ships
+        self.available = available
+
+    def __str__(self):
+        message = messages[self.reason].format(
+            ships=self.ships,
+            source=self.source,
+            destination=self.destination,
+            available=self.available,
+        )
+        return f"Turn {self.turn}: player {self.player_id} {message}"
+
+
+class BotError:
+    # A bot that raised an exception, or whose process stopped
+    def __init__(self, turn: int, player_id: int, reason: str, details: str):
+        self.turn = turn
+        self.player_id = player_id
+        self.reason = reason
+        self.details = details
+
+    def __str__(self):
+        message = bot_messages[self.reason].format(details=self.details.rstrip())
+        return f"Turn {self.turn}: player {self.player_id} {message}"
+
+
+class CommandErrorLog:
+    # The rejected commands of one game: a count per player and reason, and the
+    # last max_errors errors. Only the first report_limit errors of each player
+    # are written to stream (stdout by default), after which that player's
+    # errors are only counted. A report_limit of 0 reports nothing
+    kind = "invalid commands"
+
+    def __init__(self, max_errors: int = 100, report_limit: int = 3, stream=None):
+        self.report_limit = report_limit
+        self.stream = stream
+        self.errors = deque(maxlen=max_errors)
+        self.counts = {}
+        self.reported = {}
+
+    def clear(self):
+        self.errors.clear()
+        self.counts = {}
+        self.reported = {}
+
+    def add(self, error: CommandError):
+        self.errors.append(error)
+        key = error.player_id, error.reason
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+        reported = self.reported.get(error.player_id, 0)
+        if self.report_limit and reported <= self.report_limit:
+            self.reported[error.player_id] = reported + 1
+            stream = self.stream or sys.stdout
+            if reported < self.report_limit:
+                stream.write(f"{error}\n")
+            else:
+                stream.write(
+                    f"Not reporting any more {self.kind} from player "
+                    f"{error.player_id} this game\n"
+                )
+
+    def get_counts(self):
+        # Player id -> reason -> count, small enough to put on a GameResult
+        counts = {}
+        for (player_id, reason), count in self.counts.items():
+            counts.setdefault(player_id, {})[reason] = count
+        return counts
+
+
+class BotErrorLog(CommandErrorLog):
+    # The BotErrors of one game, counted and reported like rejected commands
+    kind = "bot errors"
@@ -0,0 +1,391 @@
+import argparse
+from collections import deque
+import itertools
+from multiprocessing.connection import Client, Listener
+import multiprocessing
+import os
+from os import path
+import queue
+import socket
+import sys
+import threading
+from time import monotonic, sleep
+import traceback
+
+from result_cache import get_file_digest
+
+# Environment variable read for the authkey when there is no --authkey-file
+authkey_variable = "AUTOPYLOT_AUTHKEY"
+
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+def read_authkey(authkey_file: str = None):
+    # Read from a file or the environment rather than the command line, where
+    # every user of the machine could see it. There is no default, as anyone
+    # who has the key can make the other side unpickle anything they send
+    if authkey_file:
+        with open(authkey_file, "rb") as f:
+            authkey = f.read().strip()
+    else:
+        authkey = os.environ.get(authkey_variable, "").encode()
+    if not authkey:
+        raise ValueError(
+            f"No authkey: pass --authkey-file or set {authkey_variable} to a "
+            "secret shared by the coordinator and its workers"
+        )
+    return authkey
+
+
+def get_job_digests(job, bot_path: str = "bots", map_path: str = "maps"):
+    # Content hashes of the two bots and the map a job is played with
+    bot_1, bot_2, map_file = job
+    return (
+        get_file_digest(path.join(bot_path, bot_1.filename)),
+        get_file_digest(path.join(bot_path, bot_2.filename)),
+        get_file_digest(path.join(map_path, map_file)),
+    )
+
+
+class NoWorkersError(RuntimeError):
+    pass
+
+
+class Coordinator:
+    # Hands tournament jobs to worker processes that connect over TCP, one job
+    # at a time. Each job handed out is leased to its worker for
+    # lease_seconds, and goes back to the front of the queue if the worker
+    # disconnects or the lease runs out. A job whose result comes back twice
+    # is only counted once. get_result gives up once there have been games
+    # to play but no workers for worker_timeout seconds
+    def __init__(
+        self,
+        address,
+        authkey: bytes,
+        lease_seconds: float = 600,
+        worker_timeout: float = 300,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.lease_seconds = lease_seconds
+        self.worker_timeout = worker_timeout
+        self.listener = None
+        self.condition = threading.Condition()
+        self.pending_jobs = deque()
+        # Job id -> (job, worker id, worker name, lease deadline)
+        self.leases = {}
+        self.worker_ids = itertools.count(1)
+        # Ids of the workers connected right now
+        self.workers = set()
+        # Why each worker that refused to play stopped
+        self.mismatches = []
+        self.finished_jobs = set()
+        self.results = queue.Queue()
+        self.next_job_id = 1
+        self.digests = {}
+        self.settings = None
+        self.closing = False
+        # When the coordinator last found games to play but no workers
+        self.idle_since = None
+
+    def start(self):
+        self.listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+
+    def accept_workers(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                if self.closing:
+                    return
+                # Most likely a client with the wrong authkey
+                continue
+            threading.Thread(
+                target=self.serve_worker, args=(connection,), daemon=True
+            ).start()
+
+    def serve_worker(self, connection):
+        # Workers are told apart by id, as two of them can have the same name
+        worker_id = next(self.worker_ids)
+        worker_name = f"worker {worker_id}"
+        try:
+            while True:
+                message = connection.recv()
+                if message[0] == "hello":
+                    worker_name = f"{message[1]} (worker {worker_id})"
+                    with self.condition:
+                        self.workers.add(worker_id)
+                    print(f"{worker_name} connected", file=sys.stderr)
+                elif message[0] == "request":
+                    job = self.lease_job(worker_id, worker_name)
+                    if job is None:
+                        connection.send(("done",))
+                        return
+                    connection.send(job)
+                elif message[0] == "result":
+                    self.finish_job(message[1], message[2])
+                elif message[0] == "error":
+                    # A bot crashed the game, which would also stop a local
+                    # tournament
+                    self.finish_job(message[1], RuntimeError(message[2]))
+                elif message[0] == "mismatch":
+                    reason = f"{worker_name}: {message[2]}"
+                    print(reason, file=sys.stderr)
+                    with self.condition:
+                        self.mismatches.append(reason)
+                    self.release_jobs(worker_id)
+                    return
+        except (EOFError, OSError):
+            print(f"{worker_name} disconnected", file=sys.stderr)
+            self.release_jobs(worker_id)
+        finally:
+            with self.condition:
+                self.workers.discard(worker_id)
+            connection.close()
+
+    def lease_job(self, worker_id: int, worker_name: str):
+        # Waits until there is a job for the worker, or returns None once the
+        # coordinator is closing, even if jobs are left when it stopped early
+        with self.condition:
+            while True:
+                if self.closing:
+                    return None
+                self.expire_leases()
+                if self.pending_jobs:
+                    job_id, job = self.pending_jobs.popleft()
+                    self.leases[job_id] = (
+                        job,
+                        worker_id,
+                        worker_name,
+                        monotonic() + self.lease_seconds,
+                    )
+                    return "job", job_id, job, self.digests[job_id], self.settings
+                self.condition.wait(1)
+
+    def expire_leases(self):
+        now = monotonic()
+        for job_id, (job, _, worker_name, deadline) in list(self.leases.items()):
+            if deadline < now:
+                print(
+                    f"{worker_name} took too long on job {job_id}, handing it out again",
+                    file=sys.stderr,
+                )
+                del self.leases[job_id]
+                self.pending_jobs.appendleft((job_id, job))
+                self.condition.notify()
+
+    def release_jobs(self, worker_id: int):
+        with self.condition:
+            for job_id, (job, leased_to, _, _) in list(self.leases.items()):
+                if leased_to == worker_id:
+                    del self.leases[job_id]
+                    self.pending_jobs.appendleft((job_id, job))
+            self.condition.notify_all()
+
+    def finish_job(self, job_id: int, result):
+        with self.condition:
+            self.leases.pop(job_id, None)
+            if job_id in self.finished_jobs:
+                return
+            self.finished_jobs.add(job_id)
+            # A job that expired and was queued again doesn't need playing
+            self.pending_jobs = deque(
+                (pending_id, job)
+                for pending_id, job in self.pending_jobs
+                if pending_id != job_id
+            )
+        self.results.put(result)
+
+    def get_capacity(self):
+        # Jobs worth having queued: one being played by each worker and one
+        # waiting for it, or one job while no worker is connected
+        with self.condition:
+            return 2 * len(self.workers) or 1
+
+    def add_job(self, job, settings: dict):
+        # settings are the autoplay_map keyword arguments the workers play with
+        with self.condition:
+            self.settings = settings
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            # Checked by the worker against its own copies of the files
+            self.digests[job_id] = get_job_digests(job)
+            self.pending_jobs.append((job_id, job))
+            self.condition.notify_all()
+
+    def get_result(self, timeout: float = 1):
+        # The result of the next job to finish, or None if none finishes
+        # within timeout. Also raises the error of a game a bot crashed
+        try:
+            result = self.results.get(timeout=timeout)
+        except queue.Empty:
+            self.check_workers()
+            return None
+        self.idle_since = None
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def check_workers(self):
+        with self.condition:
+            waiting = not self.workers and (self.pending_jobs or self.leases)
+        if not waiting:
+            self.idle_since = None
+        elif self.idle_since is None:
+            self.idle_since = monotonic()
+            print(
+                f"No workers connected, waiting up to "
+                f"{self.worker_timeout:.0f}s for one",
+                file=sys.stderr,
+            )
+        elif monotonic() - self.idle_since > self.worker_timeout:
+            self.give_up()
+
+    def give_up(self):
+        with self.condition:
+            pending_count = len(self.pending_jobs) + len(self.leases)
+            reasons = list(self.mismatches)
+        message = (
+            f"No workers connected for {self.worker_timeout:.0f}s with "
+            f"{pending_count} games left to play"
+        )
+        if reasons:
+            message += ". Workers that refused to play:\n" + "\n".join(reasons)
+        raise NoWorkersError(message)
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        if self.listener is not None:
+            self.listener.close()
+
+
+def connect(address, authkey: bytes, timeout: float):
+    # Keeps trying until timeout, so workers can be started before the
+    # coordinator
+    give_up_time = monotonic() + timeout
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except ConnectionRefusedError:
+            if monotonic() > give_up_time:
+                raise
+            sleep(1)
+
+
+def run_worker(address, authkey: bytes, worker_name: str, timeout: float = 60):
+    # Imported here because tournament imports this module
+    from tournament import autoplay_map
+
+    connection = connect(address, authkey, timeout)
+    try:
+        connection.send(("hello", worker_name))
+        play_jobs(connection, autoplay_map)
+    except (EOFError, OSError):
+        # The coordinator went away, most likely because the tournament is over
+        pass
+    finally:
+        connection.close()
+
+
+def play_jobs(connection, autoplay_map):
+    while True:
+        connection.send(("request",))
+        message = connection.recv()
+        if message[0] == "done":
+            return
+
+        _, job_id, job, digests, settings = message
+        bot_1, bot_2, map_file = job
+        try:
+            local_digests = get_job_digests(job)
+        except OSError:
+            local_digests = (None, None, None)
+        different_files = [
+            file
+            for file, digest, local_digest in zip(
+                (bot_1.filename, bot_2.filename, map_file), digests, local_digests
+            )
+            if digest != local_digest
+        ]
+        if different_files:
+            # A worker that would play different games stops, and its job goes
+            # to another worker
+            message = (
+                f"{', '.join(different_files)} missing or different from the "
+                "coordinator's"
+            )
+            print(f"Stopping: {message}", file=sys.stderr)
+            connection.send(("mismatch", job_id, message))
+            return
+
+        try:
+            result = autoplay_map(job, **settings)
+        except Exception:
+            connection.send(("error", job_id, traceback.format_exc()))
+        else:
+            connection.send(("result", job_id, result))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play games for a tournament.py --coordinator on another machine"
+    )
+    parser.add_argument(
+        "coordinator", metavar="HOST:PORT", help="address of the coordinator"
+    )
+    parser.add_argument(
+        "--authkey-file",
+        metavar="FILE",
+        help="file holding the shared secret, which must match the coordinator's "
+        f"(default: the {authkey_variable} environment variable)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="number of games to play at once (default: all cores)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="seconds to keep trying to reach the coordinator (default: 60)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Run from the repository root, with the same bots and maps as the
+    # coordinator
+    args = parse_args(argv)
+    address = parse_address(args.coordinator)
+    try:
+        authkey = read_authkey(args.authkey_file)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(
+                address,
+                authkey,
+                f"{socket.gethostname()}-{number}",
+                args.timeout,
+            ),
+        )
+        for number in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
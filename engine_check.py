@@ -0,0 +1,212 @@
+import argparse
+import hashlib
+import json
+import os
+from os import path
+import random
+import sys
+import tempfile
+
+from benchmark import bot_pairs, seed
+from game_state import Bot, GameController
+from map_store import MapStore
+from replay import Replay, ReplayPlayer, ReplayRecorder
+from result_cache import get_game_seed
+from tournament import engines, filter_names
+from vector_env import VectorGameEnv
+
+default_maps = [f"map{number}.txt" for number in range(1, 11)]
+# Turns a replay is sought to, out of order so seeks go both ways
+seek_turns = (1, 120, 49, 50, 51, 333, 7, 250, 499, 500)
+
+
+def get_state_digest(game_state):
+    # Everything that decides the rest of the game
+    digest = hashlib.sha256()
+    for planet in game_state.planets:
+        digest.update(repr((planet.player_id, planet.ships)).encode())
+    for fleet in game_state.fleets:
+        digest.update(
+            repr(
+                (
+                    fleet.fleet_id,
+                    fleet.player_id,
+                    fleet.ships,
+                    fleet.source_planet,
+                    fleet.destination_planet,
+                    fleet.turns_remaining,
+                )
+            ).encode()
+        )
+    return digest.hexdigest()[:16]
+
+
+def get_outcome(result, state_digests: list):
+    # (winning player, turns, digest of the state after every turn)
+    return [
+        result.winning_player,
+        result.turn,
+        hashlib.sha256("".join(state_digests).encode()).hexdigest()[:16],
+    ]
+
+
+def play_game(controller_class, map_store: MapStore, bots: tuple, map_file: str):
+    # Returns the result, the digest of the state after every turn, and the
+    # game's ReplayRecorder when played by the object engine
+    random.seed(get_game_seed(seed, *bots, map_file))
+    controller = controller_class(map_store)
+    controller.command_errors.report_limit = 0
+    if controller_class is GameController:
+        controller.replay = ReplayRecorder()
+    controller.start_game(*bots)
+    controller.load_map_file("maps/" + map_file)
+    state_digests = []
+    while True:
+        controller.turn_step()
+        state_digests.append(get_state_digest(controller.game_state))
+        result = controller.get_game_result()
+        if result:
+            return result, state_digests, controller.replay
+
+
+def play_vector_game(map_store: MapStore, bots: tuple, map_file: str):
+    random.seed(get_game_seed(seed, *bots, map_file))
+    env = VectorGameEnv([("maps/" + map_file, *bots)], map_store)
+    state_digests = []
+    while True:
+        results, done = env.step()
+        state_digests.append(get_state_digest(env.get_game_state(0, 1)))
+        if done[0]:
+            return results[0], state_digests
+
+
+def check_replay(replay_recorder, result, state_digests: list):
+    # Returns the turns a replay of the game seeks to differently
+    with tempfile.TemporaryDirectory() as temp_path:
+        replay_file = path.join(temp_path, "game.replay")
+        replay_recorder.save(replay_file, result)
+        player = ReplayPlayer(Replay.load(replay_file))
+    wrong_turns = []
+    for turn in seek_turns:
+        if turn > result.turn:
+            continue
+        player.seek(turn)
+        if get_state_digest(player.controller.game_state) != state_digests[turn - 1]:
+            wrong_turns.append(turn)
+    return wrong_turns
+
+
+def get_first_difference(state_digests: list, other_digests: list):
+    for turn, (digest, other_digest) in enumerate(zip(state_digests, other_digests), 1):
+        if digest != other_digest:
+            return turn
+    return min(len(state_digests), len(other_digests)) + 1
+
+
+def check_games(map_files: list):
+    # Yields (game name, outcome, differences) for every game, where each
+    # difference is a line about another engine that played it differently
+    # from the object engine
+    map_store = MapStore.from_files("maps")
+    for bot_files in bot_pairs:
+        bots = tuple(Bot(bot_file) for bot_file in bot_files)
+        for map_file in map_files:
+            name = f"{bots[0].name}-{bots[1].name}-{map_file}"
+            result, state_digests, replay_recorder = play_game(
+                GameController, map_store, bots, map_file
+            )
+            differences = []
+            others = {
+                engine_name: play_game(controller_class, map_store, bots, map_file)
+                for engine_name, controller_class in engines.items()
+                if controller_class is not GameController
+            }
+            others["VectorGameEnv"] = play_vector_game(map_store, bots, map_file)
+            for other_name, (other_result, other_digests, *_) in others.items():
+                if other_digests != state_digests or (
+                    other_result.winning_player != result.winning_player
+                ):
+                    turn = get_first_difference(state_digests, other_digests)
+                    differences.append(f"{other_name} differs from turn {turn}")
+            wrong_turns = check_replay(replay_recorder, result, state_digests)
+            if wrong_turns:
+                differences.append(
+                    f"the replay differs on turns {', '.join(map(str, wrong_turns))}"
+                )
+            yield name, get_outcome(result, state_digests), differences
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that every engine plays the benchmark games the same way"
+    )
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        metavar="MAP",
+        help="map names or glob patterns to play on (default: map1 to map10)",
+    )
+    parser.add_argument(
+        "--outcomes",
+        default="engine_outcomes.json",
+        metavar="FILE",
+        help="recorded outcome of every game (default: engine_outcomes.json)",
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="record the outcomes instead of checking them, after a change that "
+        "is meant to change games",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.maps:
+        map_files = filter_names(sorted(os.listdir("maps")), args.maps, ".txt")
+    else:
+        map_files = default_maps
+    if not map_files:
+        sys.exit("No maps to play (check the --maps filter)")
+
+    recorded = {}
+    if not args.save:
+        with open(args.outcomes, "r") as f:
+            recorded = json.load(f)["games"]
+
+    outcomes = {}
+    problems = []
+    for name, outcome, differences in check_games(map_files):
+        outcomes[name] = outcome
+        problems += [f"{name}: {difference}" for difference in differences]
+        if not args.save and name in recorded and recorded[name] != outcome:
+            problems.append(
+                f"{name}: played differently from {args.outcomes} "
+                f"({recorded[name]}, now {outcome})"
+            )
+        print(f"{name}: {'differs' if differences else 'same'}", flush=True)
+
+    if problems:
+        sys.exit(
+            "\n".join(problems) + "\nIf the games are meant to change, bump "
+            "GameController.engine_version and record them again with --save"
+        )
+    if args.save:
+        with open(args.outcomes, "w") as f:
+            json.dump(
+                {
+                    "engine_version": GameController.engine_version,
+                    "games": outcomes,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Recorded {len(outcomes)} outcomes in {args.outcomes}")
+    else:
+        print(f"Every engine played all {len(outcomes)} games the same way")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,29 @@
-import copy
 import importlib
 import math
+import os
+import random
+from time import perf_counter
+from types import MappingProxyType
+import warnings
+
+from bot_process import BotProcess, BotProcessError
+from bot_timing import BotTimeout, LatencyHistogram, TimeBudget, call_with_deadline
+from command_errors import BotError, BotErrorLog, CommandError, CommandErrorLog
+
+
+# Modification time of each bot module's file when it was last (re)loaded
+bot_module_mtimes = {}
+
+
+def load_bot_module(module_name: str):
+    # Imports bots.<module_name>, reloading it if the file changed since it was
+    # last loaded so edits to a bot are picked up by long running processes
+    module = importlib.import_module("bots." + module_name)
+    mtime = os.stat(module.__file__).st_mtime_ns
+    if bot_module_mtimes.setdefault(module_name, mtime) != mtime:
+        module = importlib.reload(module)
+        bot_module_mtimes[module_name] = mtime
+    return module
 
 
 class Bot:
@@ -13,7 +36,7 @@ class Bot:
         return f"Bot:{self.name}:{self.player_id}"
 
     def get_module(self):
-        return importlib.import_module("bots." + self.module_name)
+        return load_bot_module(self.module_name)
 
 
 class Fleet:
@@ -40,6 +63,43 @@ class Fleet:
         return self.total_trip_length - self.turns_remaining
 
 
+class MovingFleet(Fleet):
+    # The engine's fleets, whose turns_remaining is worked out from how many
+    # times the fleets have moved since it was set, rather than counted down
+    # every turn. Subtracting whole turns from a trip length is exact, so this
+    # gives the same value as counting down one turn at a time
+    def __init__(
+        self,
+        ships: int,
+        player_id: int,
+        source_planet: int,
+        destination_planet: int,
+        total_trip_length: int,
+        game_state: "GameState",
+    ):
+        self.game_state = game_state
+        super().__init__(
+            ships, player_id, source_planet, destination_planet, total_trip_length
+        )
+
+    @property
+    def turns_remaining(self):
+        return self.set_turns_remaining - (
+            self.game_state.fleet_moves - self.set_on_move
+        )
+
+    @turns_remaining.setter
+    def turns_remaining(self, turns_remaining: float):
+        # Must be set before the fleet is added to its GameState, which is
+        # when its arrival is scheduled
+        self.set_turns_remaining = turns_remaining
+        self.set_on_move = self.game_state.fleet_moves
+
+    def get_arrival_move(self):
+        # The move on which turns_remaining drops to zero or below
+        return self.set_on_move + max(math.ceil(self.set_turns_remaining), 1)
+
+
 class Planet:
     def __init__(
         self,
@@ -60,6 +120,189 @@ class Planet:
         return f"Planet:{self.planet_id}"
 
 
+class Snapshot:
+    # Read-only copy of an engine object that can be shared between bots
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self} is a read-only snapshot")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self} is a read-only snapshot")
+
+    @classmethod
+    def of(cls, obj):
+        snapshot = object.__new__(cls)
+        snapshot.__dict__.update(obj.__dict__)
+        return snapshot
+
+
+class PlanetSnapshot(Snapshot, Planet):
+    pass
+
+
+class FleetSnapshot(Snapshot, Fleet):
+    @classmethod
+    def of(cls, fleet: Fleet):
+        # Copies the fleet's current turns_remaining rather than whatever it
+        # is worked out from
+        snapshot = object.__new__(cls)
+        snapshot.__dict__.update(
+            ships=fleet.ships,
+            player_id=fleet.player_id,
+            source_planet=fleet.source_planet,
+            destination_planet=fleet.destination_planet,
+            total_trip_length=fleet.total_trip_length,
+            turns_remaining=fleet.turns_remaining,
+            fleet_id=fleet.fleet_id,
+        )
+        return snapshot
+
+
+class SnapshotClock(Snapshot):
+    # Number of times the engine had moved the fleets when the snapshots were
+    # last handed out, which MovingFleetSnapshots work out turns_remaining from
+    def __init__(self):
+        self.__dict__["fleet_moves"] = 0
+
+
+class MovingFleetSnapshot(FleetSnapshot):
+    # Snapshot of a MovingFleet, taken once when the fleet is launched rather
+    # than every turn. Its turns_remaining is worked out the same way as the
+    # fleet's, from the SnapshotClock instead of the engine's GameState
+    @classmethod
+    def of(cls, fleet: MovingFleet, clock: SnapshotClock):
+        snapshot = object.__new__(cls)
+        snapshot.__dict__.update(
+            ships=fleet.ships,
+            player_id=fleet.player_id,
+            source_planet=fleet.source_planet,
+            destination_planet=fleet.destination_planet,
+            total_trip_length=fleet.total_trip_length,
+            set_turns_remaining=fleet.set_turns_remaining,
+            set_on_move=fleet.set_on_move,
+            clock=clock,
+            fleet_id=fleet.fleet_id,
+        )
+        return snapshot
+
+    @property
+    def turns_remaining(self):
+        return self.set_turns_remaining - (self.clock.fleet_moves - self.set_on_move)
+
+
+class SnapshotCache:
+    def __init__(self):
+        self.planets = []
+        self.planet_positions = MappingProxyType({})
+        self.planet_index = MappingProxyType({})
+        self.changed_planets = set()
+        self.planets_view = ()
+        self.clock = SnapshotClock()
+        # Fleet id -> snapshot of every fleet in flight, in launch order, and
+        # the destinations whose incoming fleets changed since the last state
+        self.fleets = {}
+        self.changed_destinations = set()
+        self.fleets_view = ()
+        self.fleet_index = MappingProxyType({})
+        self.incoming_fleets = self.incoming_ships = MappingProxyType({})
+
+    def reset(self, game_state: "GameState"):
+        self.planets = [PlanetSnapshot.of(planet) for planet in game_state.planets]
+        # Planets are never added or reordered once the map is loaded, so every
+        # snapshot can share the engine's id -> position index
+        self.planet_positions = MappingProxyType(game_state.planet_positions)
+        self.planet_index = MappingProxyType(
+            {planet.planet_id: planet for planet in self.planets}
+        )
+        self.changed_planets = set()
+        self.planets_view = tuple(self.planets)
+        self.clock = SnapshotClock()
+        self.fleets = {}
+        self.changed_destinations = set()
+        self.fleets_view = ()
+        self.fleet_index = MappingProxyType({})
+        self.incoming_fleets = self.incoming_ships = MappingProxyType({})
+        for fleet in game_state.fleets:
+            self.fleet_launched(fleet)
+
+    def planet_changed(self, planet: Planet):
+        self.changed_planets.add(planet)
+
+    def fleet_launched(self, fleet: MovingFleet):
+        self.fleets[fleet.fleet_id] = MovingFleetSnapshot.of(fleet, self.clock)
+        self.changed_destinations.add(fleet.destination_planet)
+
+    def fleets_landed(self, fleets: list):
+        for fleet in fleets:
+            del self.fleets[fleet.fleet_id]
+            self.changed_destinations.add(fleet.destination_planet)
+
+    def get_planets(self, planets: list):
+        # Only the planets that changed since the last snapshot are copied again
+        if self.changed_planets:
+            # A new index rather than updating the old one, which the states
+            # already handed out still use
+            planet_index = dict(self.planet_index)
+            for planet in self.changed_planets:
+                snapshot = PlanetSnapshot.of(planet)
+                self.planets[self.planet_positions[planet.planet_id]] = snapshot
+                planet_index[planet.planet_id] = snapshot
+            self.changed_planets.clear()
+            self.planets_view = tuple(self.planets)
+            self.planet_index = MappingProxyType(planet_index)
+        return self.planets_view
+
+    def get_fleets(self, game_state: "GameState"):
+        # Each fleet is only snapshotted when it is launched, and only the
+        # incoming fleets of the destinations fleets were launched at or
+        # landed on are indexed again. The views and indexes are new copies,
+        # which are cheap C-level copies, rather than updates to the old ones
+        self.clock.__dict__["fleet_moves"] = game_state.fleet_moves
+        if self.changed_destinations:
+            fleets = self.fleets
+            incoming_fleets = dict(self.incoming_fleets)
+            incoming_ships = dict(self.incoming_ships)
+            for destination in self.changed_destinations:
+                engine_fleets = game_state.incoming_fleets.get(destination)
+                if engine_fleets:
+                    incoming_fleets[destination] = tuple(
+                        fleets[fleet.fleet_id] for fleet in engine_fleets
+                    )
+                    incoming_ships[destination] = tuple(
+                        game_state.incoming_ships[destination]
+                    )
+                else:
+                    incoming_fleets.pop(destination, None)
+                    incoming_ships.pop(destination, None)
+            self.changed_destinations.clear()
+            self.fleets_view = tuple(fleets.values())
+            self.fleet_index = MappingProxyType(dict(fleets))
+            self.incoming_fleets = MappingProxyType(incoming_fleets)
+            self.incoming_ships = MappingProxyType(incoming_ships)
+        return self.fleets_view
+
+
+def index_incoming_fleets(fleets):
+    # Read-only destination id -> fleets heading there in launch order, and
+    # destination id -> ships heading there indexed by player id
+    incoming_fleets = {}
+    incoming_ships = {}
+    for fleet in fleets:
+        incoming_fleets.setdefault(fleet.destination_planet, []).append(fleet)
+        ships = incoming_ships.setdefault(fleet.destination_planet, [0, 0, 0])
+        ships[fleet.player_id] += fleet.ships
+    return (
+        MappingProxyType(
+            {
+                destination: tuple(fleets)
+                for destination, fleets in incoming_fleets.items()
+            }
+        ),
+        MappingProxyType(
+            {destination: tuple(ships) for destination, ships in incoming_ships.items()}
+        ),
+    )
+
+
 class FleetCommand:
     def __init__(self, source_planet: int, destination_planet: int, ships: int):
         self.source_planet = source_planet
@@ -67,15 +310,65 @@ class FleetCommand:
         self.ships = ships
 
 
+class SleepHint:
+    # Returned by a bot among its commands to not be called again until:
+    #  - the turn until_turn starts
+    #  - planet_lost: another player captures one of the bot's planets
+    #  - enemy_fleet: the enemy launches a fleet at one of the bot's planets
+    #  - planet_ships: planet id -> ships, one of those planets reaches that
+    #    many ships
+    # whichever comes first. The bot plays no commands while it sleeps, so it
+    # should only sleep when it would have returned none anyway
+    def __init__(
+        self,
+        until_turn: int = None,
+        planet_lost: bool = False,
+        enemy_fleet: bool = False,
+        planet_ships: dict = None,
+    ):
+        self.until_turn = until_turn
+        self.planet_lost = planet_lost
+        self.enemy_fleet = enemy_fleet
+        self.planet_ships = planet_ships or {}
+
+
 class GameResult:
     def __init__(
-        self, map_name: str, bot_1: Bot, bot_2: Bot, winning_player: int, turn: int
+        self,
+        map_name: str,
+        bot_1: Bot,
+        bot_2: Bot,
+        winning_player: int,
+        turn: int,
+        bot_latency: dict = None,
+        timeouts: dict = None,
+        forfeited_players: tuple = (),
+        cached: bool = False,
+        metrics=None,
+        command_errors: dict = None,
+        bot_errors: dict = None,
     ):
         self.map_name = map_name
         self.bot_1 = bot_1
         self.bot_2 = bot_2
         self.winning_player = winning_player
         self.turn = turn
+        # Player id -> LatencyHistogram of that bot's per-turn thinking time
+        self.bot_latency = bot_latency or {}
+        # Player id -> number of turns the bot overran its time budget
+        self.timeouts = timeouts or {}
+        # Players that lost by overrunning a "forfeit" time budget, or whose
+        # bot process stopped
+        self.forfeited_players = forfeited_players
+        # Whether the result came from a result_cache.ResultCache instead of a game
+        self.cached = cached
+        # The game's instrumentation.Metrics, if the controller had one attached
+        self.metrics = metrics
+        # Player id -> reason -> number of commands rejected for that reason
+        self.command_errors = command_errors or {}
+        # Player id -> reason -> number of times the bot raised an exception
+        # ("exception") or its process stopped ("process_stopped")
+        self.bot_errors = bot_errors or {}
 
     def __str__(self):
         if self.winning_player == 0:
@@ -83,7 +376,8 @@ class GameResult:
         else:
             winning_bot = self.bot_1 if self.winning_player == 1 else self.bot_2
             losing_bot = self.bot_1 if self.winning_player == 2 else self.bot_2
-            return f"{winning_bot} defeated {losing_bot} on {self.map_name} on turn {self.turn}"
+            forfeit = " (forfeited)" if self.forfeited_players else ""
+            return f"{winning_bot} defeated {losing_bot}{forfeit} on {self.map_name} on turn {self.turn}"
 
     def get_winning_bot(self):
         return (
@@ -104,21 +398,86 @@ class GameResult:
         )
 
 
+def read_map_file(map_file: str):
+    # Returns one (x_pos, y_pos, player_id, ships, ship_growth) tuple per planet
+    planets = []
+    with open(map_file, "r") as f:
+        for line in f:
+            affix, x_pos, y_pos, player_id, ships, ship_growth = line.split(" ")
+            planets.append(
+                (
+                    float(x_pos),
+                    float(y_pos),
+                    int(player_id),
+                    int(ships),
+                    int(ship_growth),
+                )
+            )
+    return planets
+
+
 class GameController:
     turn_limit = 500
+    # Part of every result cache key, so bump it whenever a change to the
+    # engine can change the outcome of a game
+    engine_version = 1
 
-    def __init__(self):
+    def __init__(
+        self, map_store=None, time_budget: TimeBudget = None, isolate_bots=False
+    ):
         self.bot_1 = self.bot_2 = None
+        self.bot_1_get_commands = self.bot_2_get_commands = None
+        # With isolate_bots each bot runs in its own BotProcess for the game
+        self.isolate_bots = isolate_bots
+        self.bot_processes = {}
+        self.time_budget = time_budget
+        self.bot_latency = {1: LatencyHistogram(), 2: LatencyHistogram()}
+        self.bot_time_used = {1: 0.0, 2: 0.0}
+        self.timeouts = {1: 0, 2: 0}
+        self.forfeited_players = set()
+        # Player id -> (SleepHint, ids of the planets it owned when it fell
+        # asleep, (planet id, ships) for each known planet in planet_ships)
+        self.sleeping_players = {}
         self.turn_count = 0
         self.game_state = None
         self.selected_map = None
+        self.snapshots = SnapshotCache()
+        # Optional map_store.MapStore of pre-parsed maps to load from instead of disk
+        self.map_store = map_store
+        # Optional replay.ReplayRecorder that every accepted command is written to
+        self.replay = None
+        # Commands rejected by process_command, reported to stdout at a limited rate
+        self.command_errors = CommandErrorLog()
+        # Exceptions and stopped processes of isolated bots, reported the same way
+        self.bot_errors = BotErrorLog()
+        # Optional instrumentation.Metrics that the phases of every turn are
+        # timed and counted into
+        self.metrics = None
 
     def start_game(self, bot_1: Bot, bot_2: Bot):
         self.bot_1 = bot_1
         self.bot_1.player_id = 1
         self.bot_2 = bot_2
         self.bot_2.player_id = 2
+        self.stop_bot_processes()
+        if self.isolate_bots:
+            self.bot_processes = {
+                1: BotProcess(bot_1.module_name, random.getrandbits(64)),
+                2: BotProcess(bot_2.module_name, random.getrandbits(64)),
+            }
+        else:
+            # Resolved once per game rather than importing the bot modules every turn
+            self.bot_1_get_commands = bot_1.get_module().get_commands
+            self.bot_2_get_commands = bot_2.get_module().get_commands
+        self.bot_latency = {1: LatencyHistogram(), 2: LatencyHistogram()}
+        self.bot_time_used = {1: 0.0, 2: 0.0}
+        self.timeouts = {1: 0, 2: 0}
+        self.forfeited_players = set()
+        self.sleeping_players = {}
+        self.command_errors.clear()
+        self.bot_errors.clear()
         self.game_state = GameState()
+        self.snapshots = SnapshotCache()
         self.turn_count = 0
 
     def get_player_bot(self, player_id: int):
@@ -128,26 +487,44 @@ class GameController:
             return self.bot_2
 
     def copy_game_state(self, current_player: int):
-        state = copy.deepcopy(self.game_state)
+        # Both bots share the same read-only planets and fleets, so nothing the
+        # bots do to their state can leak back into the engine or to each other.
+        # Each bot still gets lists of its own, as it did with deepcopy, which
+        # it is free to sort or change
+        state = GameState()
+        state.planets = list(self.snapshots.get_planets(self.game_state.planets))
+        state.fleets = list(self.snapshots.get_fleets(self.game_state))
+        state.planet_positions = self.snapshots.planet_positions
+        state.planet_index = self.snapshots.planet_index
+        state.fleet_index = self.snapshots.fleet_index
+        state.incoming_fleets = self.snapshots.incoming_fleets
+        state.incoming_ships = self.snapshots.incoming_ships
+        state.trip_lengths = self.game_state.trip_lengths
+        state.planet_ships = tuple(self.game_state.planet_ships)
+        state.fleet_ships = tuple(self.game_state.fleet_ships)
+        state.planet_counts = tuple(self.game_state.planet_counts)
+        state.next_fleet_id = self.game_state.next_fleet_id
         state.current_player = current_player
         state.enemy_player = 2 if current_player == 1 else 1
         return state
 
     def load_map_file(self, map_file: str):
+        planets = self.map_store.get_planets(map_file) if self.map_store else None
+        if planets is None:
+            planets = read_map_file(map_file)
+        self.load_map(map_file, planets)
+
+    def load_map(self, map_name: str, planets: list):
         planet_id = 1
-        with open(map_file, "r") as f:
-            for line in f:
-                affix, x_pos, y_pos, player_id, ships, ship_growth = line.split(" ")
-                x_pos, y_pos = float(x_pos), float(y_pos)
-                player_id, ships, ship_growth = (
-                    int(player_id),
-                    int(ships),
-                    int(ship_growth),
-                )
-                planet = Planet(planet_id, x_pos, y_pos, player_id, ships, ship_growth)
-                self.game_state.planets.append(planet)
-                planet_id += 1
-        self.selected_map = map_file
+        for x_pos, y_pos, player_id, ships, ship_growth in planets:
+            planet = Planet(planet_id, x_pos, y_pos, player_id, ships, ship_growth)
+            self.game_state.add_planet(planet)
+            planet_id += 1
+        self.selected_map = map_name
+        self.game_state.get_trip_lengths()
+        self.snapshots.reset(self.game_state)
+        if self.replay is not None:
+            self.replay.start(map_name, planets)
 
     def get_extents(self):
         min_x = min([planet.x_pos for planet in self.game_state.get_planets()])
@@ -161,45 +538,282 @@ class GameController:
 
         self.turn_count += 1
 
-        bot_1_commands = self.bot_1.get_module().get_commands(self.copy_game_state(1))
-        bot_2_commands = self.bot_2.get_module().get_commands(self.copy_game_state(2))
+        if self.bot_processes:
+            bot_1_commands, bot_2_commands = self.get_process_commands()
+        else:
+            bot_1_commands = self.get_bot_commands(1)
+            bot_2_commands = self.get_bot_commands(2)
+
+        self.play_turn(bot_1_commands, bot_2_commands)
+
+    def play_turn(self, bot_1_commands, bot_2_commands):
+        # Everything after the bots are asked for their commands, which is also
+        # how replays are played back without calling the bots
+        metrics = self.metrics
+        if metrics is None:
+            self.process_commands(bot_1_commands, 1)
+            self.process_commands(bot_2_commands, 2)
+            self.move_fleets()
+            self.grow_planets()
+        else:
+            # Launches, landings and captures are timed as sections of their
+            # own inside these
+            metrics.count("turns")
+            metrics.start_section("command validation")
+            self.process_commands(bot_1_commands, 1)
+            self.process_commands(bot_2_commands, 2)
+            metrics.end_section()
+            metrics.start_section("fleet moves")
+            self.move_fleets()
+            metrics.end_section()
+            metrics.start_section("growth")
+            self.grow_planets()
+            metrics.end_section()
+
+        if self.replay is not None:
+            self.replay.end_turn(self.turn_count, self.game_state)
+
+    def get_deadline(self, player_id: int):
+        # (seconds the bot has this turn or None, whether it is stopped then)
+        budget = self.time_budget
+        if budget is None:
+            return None, False
+        deadline = budget.get_deadline(self.bot_time_used[player_id])
+        return deadline, deadline is not None and budget.policy != "warn"
+
+    def get_bot_state(self, player_id: int):
+        if self.metrics is None:
+            return self.copy_game_state(player_id)
+
+        start_time = perf_counter()
+        state = self.copy_game_state(player_id)
+        self.metrics.lap("snapshot copy", start_time)
+        return state
+
+    def get_bot_commands(self, player_id: int):
+        if self.is_asleep(player_id):
+            return None
+
+        get_commands = (
+            self.bot_1_get_commands if player_id == 1 else self.bot_2_get_commands
+        )
+        deadline, enforce = self.get_deadline(player_id)
+        if enforce and deadline <= 0:
+            # A bot that has used up its whole game budget isn't called again
+            return None
+
+        state = self.get_bot_state(player_id)
+        timed_out = False
+        start_time = perf_counter()
+        try:
+            commands = call_with_deadline(
+                get_commands, state, deadline if enforce else None
+            )
+        except BotTimeout:
+            commands = None
+            timed_out = True
+        elapsed = perf_counter() - start_time
+
+        return self.read_sleep_hint(
+            player_id,
+            self.record_bot_time(player_id, commands, elapsed, deadline, timed_out),
+        )
+
+    def get_process_commands(self):
+        # Both bot processes are sent the turn before either is waited on, so
+        # the bots think at the same time
+        deadlines = {}
+        for player_id, process in self.bot_processes.items():
+            deadline, enforce = self.get_deadline(player_id)
+            if player_id in self.forfeited_players or (enforce and deadline <= 0):
+                continue
+            if self.is_asleep(player_id):
+                continue
+            try:
+                if process.is_busy():
+                    # Still thinking about a turn it ran out of time on
+                    self.timeouts[player_id] += 1
+                    continue
+                process.send_turn(self.turn_count, self.get_bot_state(player_id))
+            except BotProcessError as e:
+                self.add_bot_error(player_id, "process_stopped", str(e))
+                self.forfeited_players.add(player_id)
+                continue
+            deadlines[player_id] = deadline, enforce
+
+        commands = {1: None, 2: None}
+        for player_id, (deadline, enforce) in deadlines.items():
+            try:
+                player_commands, elapsed, timed_out, error = self.bot_processes[
+                    player_id
+                ].receive(deadline if enforce else None)
+            except BotProcessError as e:
+                self.add_bot_error(player_id, "process_stopped", str(e))
+                self.forfeited_players.add(player_id)
+                continue
+            if error is not None:
+                self.add_bot_error(player_id, "exception", error)
+            commands[player_id] = self.read_sleep_hint(
+                player_id,
+                self.record_bot_time(
+                    player_id, player_commands, elapsed, deadline, timed_out
+                ),
+            )
+        return commands[1], commands[2]
+
+    def read_sleep_hint(self, player_id: int, commands):
+        # Returns the bot's commands without any SleepHint, and puts the bot
+        # to sleep if there was one
+        if isinstance(commands, SleepHint):
+            commands = [commands]
+        if not isinstance(commands, list) or not any(
+            isinstance(command, SleepHint) for command in commands
+        ):
+            return commands
+
+        hints = [command for command in commands if isinstance(command, SleepHint)]
+        hint = hints[-1]
+        planet_ids = ()
+        if hint.planet_lost:
+            planet_ids = tuple(
+                planet.planet_id
+                for planet in self.game_state.planets
+                if planet.player_id == player_id
+            )
+        # Unknown planets are ignored, like commands for them are
+        planet_ships = tuple(
+            (planet_id, ships)
+            for planet_id, ships in hint.planet_ships.items()
+            if planet_id in self.game_state.planet_positions
+        )
+        self.sleeping_players[player_id] = hint, planet_ids, planet_ships
+        return [command for command in commands if not isinstance(command, SleepHint)]
+
+    def is_asleep(self, player_id: int):
+        # Whether the bot is still asleep this turn, waking it up if one of its
+        # SleepHint's conditions has been met. Enemy fleets wake it up as
+        # they are launched, in process_command
+        sleep = self.sleeping_players.get(player_id)
+        if sleep is None:
+            return False
+
+        hint, planet_ids, planet_ships = sleep
+        game_state = self.game_state
+        if (
+            (hint.until_turn is not None and self.turn_count >= hint.until_turn)
+            or any(
+                game_state.get_planet(planet_id).player_id != player_id
+                for planet_id in planet_ids
+            )
+            or any(
+                game_state.get_planet(planet_id).ships >= ships
+                for planet_id, ships in planet_ships
+            )
+        ):
+            del self.sleeping_players[player_id]
+            return False
+
+        if self.metrics is not None:
+            self.metrics.count("bot turns slept")
+        return True
+
+    def stop_bot_processes(self):
+        for process in self.bot_processes.values():
+            process.close()
+        self.bot_processes = {}
+
+    def record_bot_time(
+        self, player_id: int, commands, elapsed: float, deadline: float, timed_out: bool
+    ):
+        # Returns the commands to play, which depends on the overrun policy
+        # when the bot ran out of time
+        budget = self.time_budget
+        self.bot_latency[player_id].add(elapsed)
+        if self.metrics is not None:
+            self.metrics.add_time(
+                "get_commands", elapsed, self.get_player_bot(player_id).name
+            )
+        self.bot_time_used[player_id] += elapsed
 
-        if bot_1_commands:
-            if not isinstance(bot_1_commands, list):
-                bot_1_commands = [bot_1_commands]
+        if not timed_out and (deadline is None or elapsed <= deadline):
+            return commands
 
-            for command in bot_1_commands:
-                self.process_command(command, 1)
+        self.timeouts[player_id] += 1
+        if budget.policy == "warn":
+            warnings.warn(
+                f"{self.get_player_bot(player_id)} took {elapsed:.3f}s on turn "
+                f"{self.turn_count} (budget {deadline:.3f}s)",
+                RuntimeWarning,
+            )
+            return commands
 
-        if bot_2_commands:
-            if not isinstance(bot_2_commands, list):
-                bot_2_commands = [bot_2_commands]
+        if budget.policy == "forfeit":
+            self.forfeited_players.add(player_id)
+        return None
 
-            for command in bot_2_commands:
-                self.process_command(command, 2)
+    def process_commands(self, commands, player_id: int):
+        if not commands:
+            return
 
-        for fleet in self.game_state.fleets:
-            fleet.turns_remaining -= 1
-            if fleet.turns_remaining <= 0:
+        if not isinstance(commands, list):
+            commands = [commands]
+
+        if self.metrics is not None:
+            self.metrics.count("commands received", len(commands))
+
+        for command in commands:
+            self.process_command(command, player_id)
+
+    def move_fleets(self):
+        # Only the fleets arriving on this move are touched, in launch order
+        game_state = self.game_state
+        game_state.fleet_moves += 1
+        landed_fleets = game_state.fleet_arrivals.pop(game_state.fleet_moves, None)
+        if landed_fleets:
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.count("fleet landings", len(landed_fleets))
+                metrics.start_section("fleet landings")
+            for fleet in landed_fleets:
                 self.land_fleet(fleet)
+            game_state.remove_fleets(landed_fleets)
+            self.snapshots.fleets_landed(landed_fleets)
+            if metrics is not None:
+                metrics.end_section()
 
-        self.game_state.fleets = [
-            fleet for fleet in self.game_state.fleets if fleet.turns_remaining > 0
-        ]
-
+    def grow_planets(self):
+        planet_ships = self.game_state.planet_ships
         for planet in self.game_state.planets:
-            if planet.player_id != 0:
+            if planet.player_id != 0 and planet.ship_growth:
                 planet.ships += planet.ship_growth
+                planet_ships[planet.player_id] += planet.ship_growth
+                self.snapshots.planet_changed(planet)
 
     def land_fleet(self, fleet: Fleet):
         planet = self.game_state.get_planet(fleet.destination_planet)
+        planet_ships = self.game_state.planet_ships
         if fleet.player_id == planet.player_id:
             planet.ships += fleet.ships
+            planet_ships[planet.player_id] += fleet.ships
         else:
+            # The whole attack is timed as a capture, whether or not the
+            # planet changes hands
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.start_section("planet captures")
+            planet_ships[planet.player_id] -= planet.ships
             planet.ships -= fleet.ships
             if planet.ships < 0:
+                if metrics is not None:
+                    metrics.count("planet captures")
                 planet.ships *= -1
+                self.game_state.planet_counts[planet.player_id] -= 1
+                self.game_state.planet_counts[fleet.player_id] += 1
                 planet.player_id = fleet.player_id
+            planet_ships[planet.player_id] += planet.ships
+            if metrics is not None:
+                metrics.end_section()
+        self.snapshots.planet_changed(planet)
 
     def launch_fleet(
         self, source_planet: Planet, destination_planet: Planet, ships: int
@@ -214,23 +828,27 @@ class GameController:
             )
 
         source_planet.ships -= ships
+        self.game_state.planet_ships[source_planet.player_id] -= ships
         distance = self.game_state.get_trip_length(
             source_planet.planet_id, destination_planet.planet_id
         )
-        fleet = Fleet(
+        fleet = MovingFleet(
             ships,
             source_planet.player_id,
             source_planet.planet_id,
             destination_planet.planet_id,
             distance,
+            self.game_state,
         )
         fleet.fleet_id = self.game_state.next_fleet_id
         self.game_state.next_fleet_id += 1
-        self.game_state.fleets.append(fleet)
+        self.game_state.add_fleet(fleet)
+        self.snapshots.planet_changed(source_planet)
+        self.snapshots.fleet_launched(fleet)
 
     def process_command(self, command: FleetCommand, player_id: int):
         if not isinstance(command, FleetCommand):
-            print(f"Player {player_id} returned an object that was not a FleetCommand")
+            self.reject_command(player_id, "not_a_command")
             return
 
         source_planet = self.game_state.get_planet(command.source_planet)
@@ -238,57 +856,133 @@ class GameController:
         ships = int(command.ships)
 
         if not source_planet:
-            print(
-                f"Player {player_id} tried to launch {ships} ships from unknown planet {command.source_planet}"
+            self.reject_command(
+                player_id, "unknown_source", command.source_planet, None, ships
             )
             return
 
         if ships <= 0:
-            print(
-                f'Player {player_id} tried to send an invalid number of ships "{ships}" '
-                f"from planet {source_planet} to {destination_planet}"
+            self.reject_command(
+                player_id,
+                "invalid_ships",
+                command.source_planet,
+                command.destination_planet,
+                ships,
             )
             return
 
         if ships > source_planet.ships:
-            print(
-                f"Player {player_id} tried to launch too may ships {ships} from {source_planet} "
-                f"(it has only {source_planet.ships} ships)"
+            self.reject_command(
+                player_id,
+                "too_many_ships",
+                command.source_planet,
+                command.destination_planet,
+                ships,
+                source_planet.ships,
             )
             return
 
         if not destination_planet:
-            print(
-                f"Player {player_id} tried to launch {ships} from {source_planet} "
-                f"to an unknown planet {command.destination_planet}"
+            self.reject_command(
+                player_id,
+                "unknown_destination",
+                command.source_planet,
+                command.destination_planet,
+                ships,
             )
             return
 
         if source_planet.player_id != player_id:
-            print(
-                f"Player {player_id} tried to launch {ships} ships "
-                f"from planet {source_planet} which it doesn't own"
+            self.reject_command(
+                player_id,
+                "not_owned",
+                command.source_planet,
+                command.destination_planet,
+                ships,
             )
             return
 
         if source_planet == destination_planet:
-            print(
-                f"Player {player_id} tried to send {ships} ships to/from {source_planet}"
+            self.reject_command(
+                player_id,
+                "same_planet",
+                command.source_planet,
+                command.destination_planet,
+                ships,
             )
             return
 
-        self.launch_fleet(source_planet, destination_planet, ships)
+        if self.replay is not None:
+            self.replay.add_command(
+                player_id, source_planet.planet_id, destination_planet.planet_id, ships
+            )
+        if self.sleeping_players:
+            enemy_player = 2 if player_id == 1 else 1
+            sleep = self.sleeping_players.get(enemy_player)
+            if (
+                sleep is not None
+                and sleep[0].enemy_fleet
+                and destination_planet.player_id == enemy_player
+            ):
+                del self.sleeping_players[enemy_player]
+        if self.metrics is None:
+            self.launch_fleet(source_planet, destination_planet, ships)
+        else:
+            self.metrics.count("fleet launches")
+            self.metrics.count("ships launched", ships)
+            self.metrics.start_section("fleet launches")
+            self.launch_fleet(source_planet, destination_planet, ships)
+            self.metrics.end_section()
+
+    def add_bot_error(self, player_id: int, reason: str, details: str):
+        self.bot_errors.add(BotError(self.turn_count, player_id, reason, details))
+
+    def reject_command(
+        self,
+        player_id: int,
+        reason: str,
+        source=None,
+        destination=None,
+        ships=None,
+        available=None,
+    ):
+        self.command_errors.add(
+            CommandError(
+                self.turn_count,
+                player_id,
+                reason,
+                source,
+                destination,
+                ships,
+                available,
+            )
+        )
+        if self.metrics is not None:
+            self.metrics.count("commands rejected")
 
     def get_game_result(self):
         lost_player = self.game_state.get_lost_player()
-        if lost_player or self.turn_count >= self.turn_limit:
-            winning_player = self.game_state.get_winning_player()
+        if self.forfeited_players or lost_player or self.turn_count >= self.turn_limit:
+            if self.forfeited_players:
+                # A bot that forfeits loses, or draws if both did
+                winning_player = {1, 2}.difference(self.forfeited_players)
+                winning_player = winning_player.pop() if winning_player else 0
+            else:
+                winning_player = self.game_state.get_winning_player()
+            # The bot processes only live as long as the game
+            self.stop_bot_processes()
             return GameResult(
                 self.selected_map,
                 self.bot_1,
                 self.bot_2,
                 winning_player,
                 self.turn_count,
+                bot_latency=self.bot_latency,
+                timeouts=self.timeouts,
+                forfeited_players=tuple(sorted(self.forfeited_players)),
+                metrics=self.metrics,
+                command_errors=self.command_errors.get_counts(),
+                bot_errors=self.bot_errors.get_counts(),
             )
 
         return None
@@ -297,17 +991,79 @@ class GameController:
 class GameState:
     def __init__(self):
         self.planets = list()
-        self.fleets = list()
+
+        # Id-keyed indexes, kept in sync by add_planet, add_fleet and
+        # remove_fleets. Planets are looked up by id rather than by position,
+        # so a bot can reorder its own list of planets
+        self.planet_positions = dict()
+        self.planet_index = dict()
+        # Fleets are kept in launch order by their id, so a fleet that lands
+        # is deleted without touching the others. fleets is a live view of
+        # them, which the states handed to bots replace with lists
+        self.fleet_index = dict()
+        self.fleets = self.fleet_index.values()
+        # Destination id -> fleets heading there in launch order, and
+        # destination id -> ships heading there indexed by player id
+        self.incoming_fleets = dict()
+        self.incoming_ships = dict()
+
+        # Number of times the engine has moved the fleets, and the MovingFleets
+        # that will land on each future move, in launch order
+        self.fleet_moves = 0
+        self.fleet_arrivals = dict()
+
+        # Read-only source id -> destination id -> trip length table, built
+        # once per map because planets never move
+        self.trip_lengths = None
+
+        # Running totals indexed by player id (0 is neutral), kept up to date by
+        # the engine so ship and planet counts don't need a scan
+        self.planet_ships = [0, 0, 0]
+        self.fleet_ships = [0, 0, 0]
+        self.planet_counts = [0, 0, 0]
 
         self.current_player = None
         self.enemy_player = None
 
         self.next_fleet_id = 1
 
-    def get_planet(self, planet_id: int):
-        return next(
-            (planet for planet in self.planets if planet.planet_id == planet_id), None
+    def add_planet(self, planet: Planet):
+        self.planet_positions[planet.planet_id] = len(self.planets)
+        self.planet_index[planet.planet_id] = planet
+        self.planets.append(planet)
+        self.trip_lengths = None
+        self.planet_ships[planet.player_id] += planet.ships
+        self.planet_counts[planet.player_id] += 1
+
+    def add_fleet(self, fleet: Fleet):
+        self.fleet_index[fleet.fleet_id] = fleet
+        self.fleet_ships[fleet.player_id] += fleet.ships
+        self.incoming_fleets.setdefault(fleet.destination_planet, []).append(fleet)
+        incoming_ships = self.incoming_ships.setdefault(
+            fleet.destination_planet, [0, 0, 0]
         )
+        incoming_ships[fleet.player_id] += fleet.ships
+        if isinstance(fleet, MovingFleet):
+            self.fleet_arrivals.setdefault(fleet.get_arrival_move(), []).append(fleet)
+
+    def remove_fleets(self, fleets: list):
+        destinations = set()
+        for fleet in fleets:
+            del self.fleet_index[fleet.fleet_id]
+            self.fleet_ships[fleet.player_id] -= fleet.ships
+            incoming_ships = self.incoming_ships[fleet.destination_planet]
+            incoming_ships[fleet.player_id] -= fleet.ships
+            destinations.add(fleet.destination_planet)
+
+        for destination in destinations:
+            self.incoming_fleets[destination] = [
+                fleet
+                for fleet in self.incoming_fleets[destination]
+                if fleet.fleet_id in self.fleet_index
+            ]
+
+    def get_planet(self, planet_id: int):
+        return self.planet_index.get(planet_id)
 
     def get_planets(self):
         return self.planets
@@ -328,9 +1084,7 @@ class GameState:
         return [planet for planet in self.planets if planet.player_id == player_id]
 
     def get_fleet(self, fleet_id):
-        return next(
-            (fleet for fleet in self.fleets if fleet.fleet_id == fleet_id), None
-        )
+        return self.fleet_index.get(fleet_id)
 
     def get_fleets(self):
         return self.fleets
@@ -347,15 +1101,31 @@ class GameState:
 
         return [fleet for fleet in self.fleets if fleet.player_id == player_id]
 
+    def get_incoming_fleets(self, planet_id: int, turns: int = None):
+        # Fleets heading to the planet in launch order, which is the order
+        # fleets landing on the same turn are resolved in. With turns, only
+        # the fleets that land within that many turns
+        fleets = self.incoming_fleets.get(planet_id, ())
+        if turns is None:
+            return fleets
+
+        return [fleet for fleet in fleets if fleet.turns_remaining <= turns]
+
+    def get_incoming_ships(self, planet_id: int, player_id: int):
+        if player_id not in [1, 2]:
+            raise ValueError("Can only get ship counts for players 1 and 2")
+
+        ships = self.incoming_ships.get(planet_id)
+        return ships[player_id] if ships else 0
+
     def is_player_alive(self, player_id: int):
         return self.get_player_planets(player_id) or self.get_player_planets(player_id)
 
     def get_total_ship_count(self, player_id: int):
-        planet_ships = sum(
-            [planet.ships for planet in self.get_player_planets(player_id)]
-        )
-        fleet_ships = sum([fleet.ships for fleet in self.get_player_fleets(player_id)])
-        return planet_ships + fleet_ships
+        if player_id not in [1, 2]:
+            raise ValueError("Can only get ship counts for players 1 and 2")
+
+        return self.planet_ships[player_id] + self.fleet_ships[player_id]
 
     def get_winning_player(self):
         player_1_ships = self.get_total_ship_count(1)
@@ -376,19 +1146,36 @@ class GameState:
         else:
             return 0
 
+    def get_player_planet_count(self, player_id: int):
+        if player_id not in [0, 1, 2]:
+            raise ValueError("Cannot get planets for players other than 0,1,2")
+
+        return self.planet_counts[player_id]
+
     def get_my_planet_count(self):
-        return len(self.get_my_planets())
+        return self.get_player_planet_count(self.current_player)
 
     def get_enemy_planet_count(self):
-        return len(self.get_enemy_planets())
+        return self.get_player_planet_count(self.enemy_player)
+
+    def get_trip_lengths(self):
+        if self.trip_lengths is None:
+            self.trip_lengths = MappingProxyType(
+                {
+                    source.planet_id: MappingProxyType(
+                        {
+                            destination.planet_id: math.hypot(
+                                source.x_pos - destination.x_pos,
+                                source.y_pos - destination.y_pos,
+                            )
+                            for destination in self.planets
+                        }
+                    )
+                    for source in self.planets
+                }
+            )
+        return self.trip_lengths
 
     def get_trip_length(self, source_planet: int, destination_planet: int):
-        x_dist = (
-            self.get_planet(source_planet).x_pos
-            - self.get_planet(destination_planet).x_pos
-        )
-        y_dist = (
-            self.get_planet(source_planet).y_pos
-            - self.get_planet(destination_planet).y_pos
-        )
-        return math.hypot(x_dist, y_dist)
+        trip_lengths = self.trip_lengths or self.get_trip_lengths()
+        return trip_lengths[source_planet][destination_planet]
@@ -0,0 +1,100 @@
+import json
+from time import perf_counter
+
+
+def escape_label(value: str):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    # Timers and counters filled in by a GameController that has one attached.
+    # Timers are keyed by (phase, bot name or None) and hold [calls, seconds],
+    # counters by event name. Only plain dicts, so a game's metrics are cheap
+    # to send back from pool workers and can be merged across games
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        # [phase, start time, seconds spent in sections inside it] of every
+        # section that has started and not ended, innermost last
+        self.sections = []
+
+    def add_time(self, phase: str, seconds: float, bot: str = None):
+        timer = self.timers.get((phase, bot))
+        if timer is None:
+            self.timers[phase, bot] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def lap(self, phase: str, start_time: float):
+        # Adds the time since start_time to phase, and returns the current
+        # time to start the next phase from
+        now = perf_counter()
+        self.add_time(phase, now - start_time)
+        return now
+
+    def start_section(self, phase: str):
+        # Sections can nest, and the time of a section doesn't include the
+        # sections inside it, so the phases of a turn add up to the turn
+        self.sections.append([phase, perf_counter(), 0.0])
+
+    def end_section(self):
+        phase, start_time, inner_seconds = self.sections.pop()
+        seconds = perf_counter() - start_time
+        self.add_time(phase, seconds - inner_seconds)
+        if self.sections:
+            self.sections[-1][2] += seconds
+
+    def count(self, event: str, amount: int = 1):
+        self.counters[event] = self.counters.get(event, 0) + amount
+
+    def merge(self, other: "Metrics"):
+        for (phase, bot), (calls, seconds) in other.timers.items():
+            timer = self.timers.setdefault((phase, bot), [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+        for event, amount in other.counters.items():
+            self.count(event, amount)
+
+    def get_sorted_timers(self):
+        return sorted(
+            self.timers.items(), key=lambda item: (item[0][0], item[0][1] or "")
+        )
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "timers": [
+                    {"phase": phase, "bot": bot, "calls": calls, "seconds": seconds}
+                    for (phase, bot), (calls, seconds) in self.get_sorted_timers()
+                ],
+                "counters": dict(sorted(self.counters.items())),
+            },
+            indent=2,
+        )
+
+    def to_prometheus(self, prefix: str = "autopylot"):
+        # Prometheus text exposition format
+        lines = []
+        timers = self.get_sorted_timers()
+        for metric, column, help_text in (
+            ("phase_seconds_total", 1, "Seconds spent in each phase of a turn"),
+            ("phase_calls_total", 0, "Number of times each phase was timed"),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for (phase, bot), values in timers:
+                labels = f'phase="{escape_label(phase)}"'
+                if bot is not None:
+                    labels += f',bot="{escape_label(bot)}"'
+                lines.append(f"{prefix}_{metric}{{{labels}}} {values[column]}")
+
+        lines.append(
+            f"# HELP {prefix}_events_total Number of times each event happened"
+        )
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for event, amount in sorted(self.counters.items()):
+            lines.append(
+                f'{prefix}_events_total{{event="{escape_label(event)}"}} {amount}'
+            )
+        return "\n".join(lines) + "\n"
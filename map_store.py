@@ -0,0 +1,153 @@
+import json
+import os
+from os import path
+import struct
+
+from game_state import read_map_file
+
+
+class MapStore:
+    # Every map parsed once and packed into a single read-only bytes buffer of
+    # (x_pos, y_pos, player_id, ships, ship_growth) records, small enough to
+    # hand to every tournament worker and to save as a compiled cache file
+    record = struct.Struct("<2d3i")
+    cache_magic = b"AUTOPYLOT-MAPS-1\n"
+
+    def __init__(self, map_path: str, data: bytes, index: dict, sources: dict):
+        self.map_path = path.normpath(map_path)
+        self.data = data
+        # map file name -> (offset of its first record, planet count)
+        self.index = index
+        # map file name -> (mtime_ns, size) of the .txt the map was parsed from
+        self.sources = sources
+        self.cache = {}
+
+    @classmethod
+    def from_files(cls, map_path: str = "maps"):
+        data = bytearray()
+        index = {}
+        sources = {}
+        for map_file in get_map_files(map_path):
+            file_path = path.join(map_path, map_file)
+            try:
+                planets = read_map_file(file_path)
+            except ValueError as e:
+                raise ValueError(f"{file_path} could not be parsed: {e}") from e
+            validate_map(file_path, planets)
+
+            index[map_file] = (len(data), len(planets))
+            for planet in planets:
+                data += cls.record.pack(*planet)
+            sources[map_file] = get_source_signature(file_path)
+        return cls(map_path, bytes(data), index, sources)
+
+    @classmethod
+    def load(cls, map_path: str = "maps", cache_file: str = None):
+        # Reuses cache_file when none of the .txt maps have changed since it
+        # was saved, otherwise re-parses every map and rewrites the cache
+        if cache_file:
+            store = cls.read_cache(map_path, cache_file)
+            if store is not None and store.is_fresh():
+                return store
+
+        store = cls.from_files(map_path)
+        if cache_file:
+            store.save(cache_file)
+        return store
+
+    @classmethod
+    def read_cache(cls, map_path: str, cache_file: str):
+        try:
+            with open(cache_file, "rb") as f:
+                if f.readline() != cls.cache_magic:
+                    return None
+                header = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+
+        if len(data) != header["size"]:
+            return None
+
+        return cls(
+            map_path,
+            data,
+            {name: tuple(entry) for name, entry in header["index"].items()},
+            {name: tuple(entry) for name, entry in header["sources"].items()},
+        )
+
+    def save(self, cache_file: str):
+        header = {"size": len(self.data), "index": self.index, "sources": self.sources}
+        temp_file = cache_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(self.cache_magic)
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(self.data)
+        os.replace(temp_file, cache_file)
+
+    def is_fresh(self):
+        try:
+            map_files = get_map_files(self.map_path)
+        except OSError:
+            return False
+
+        return set(map_files) == set(self.sources) and all(
+            get_source_signature(path.join(self.map_path, map_file))
+            == tuple(self.sources[map_file])
+            for map_file in map_files
+        )
+
+    def get_map_names(self):
+        return list(self.index)
+
+    def get_planets(self, map_file: str):
+        # Accepts the same "maps/<name>" paths as GameController.load_map_file,
+        # and returns None for maps the store doesn't hold
+        directory, map_name = path.split(path.normpath(map_file))
+        if directory != self.map_path or map_name not in self.index:
+            return None
+
+        planets = self.cache.get(map_name)
+        if planets is None:
+            offset, count = self.index[map_name]
+            planets = list(
+                self.record.iter_unpack(
+                    self.data[offset : offset + count * self.record.size]
+                )
+            )
+            self.cache[map_name] = planets
+        return planets
+
+
+def get_map_files(map_path: str = "maps"):
+    return sorted(
+        file
+        for file in os.listdir(map_path)
+        if path.isfile(path.join(map_path, file)) and file.endswith(".txt")
+    )
+
+
+def get_source_signature(file_path: str):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def validate_map(map_file: str, planets: list):
+    if not planets:
+        raise ValueError(f"{map_file} has no planets")
+
+    for line_number, (x_pos, y_pos, player_id, ships, ship_growth) in enumerate(
+        planets, 1
+    ):
+        if player_id not in [0, 1, 2]:
+            raise ValueError(
+                f"{map_file}:{line_number} has a planet owned by unknown player {player_id}"
+            )
+        if ships < 0 or ship_growth < 0:
+            raise ValueError(
+                f"{map_file}:{line_number} has a negative ship count or growth rate"
+            )
+
+    owners = {player_id for x_pos, y_pos, player_id, ships, growth in planets}
+    if not {1, 2} <= owners:
+        raise ValueError(f"{map_file} needs a starting planet for both players")
@@ -0,0 +1,225 @@
+import json
+import os
+import struct
+
+from game_state import (
+    FleetCommand,
+    GameController,
+    GameResult,
+    GameState,
+    MovingFleet,
+    SnapshotCache,
+)
+from map_store import MapStore
+
+# A replay file is a magic line, a JSON header line, the map's planets as
+# MapStore records, and then one block per turn: the number of commands that
+# turn followed by each accepted (player_id, source, destination, ships)
+# command. Every keyframe_interval turns the block is followed by a keyframe
+# of the whole state after that turn, so any turn can be rebuilt by playing at
+# most keyframe_interval turns forward from the keyframe before it
+magic = b"AUTOPYLOT-REPLAY-1\n"
+count_record = struct.Struct("<I")
+command_record = struct.Struct("<BHHi")
+# player_id, ships
+planet_record = struct.Struct("<Bi")
+# fleet count, next fleet id
+fleets_record = struct.Struct("<2I")
+# fleet_id, player_id, ships, source, destination, total trip, turns remaining
+fleet_record = struct.Struct("<IBiHHdd")
+
+
+class ReplayRecorder:
+    # Set as GameController.replay to record the game the controller plays
+    def __init__(self, keyframe_interval: int = 50):
+        self.keyframe_interval = keyframe_interval
+        self.map_name = None
+        self.planets = []
+        self.data = bytearray()
+        self.commands = []
+        self.turns = 0
+
+    def start(self, map_name: str, planets: list):
+        self.map_name = map_name
+        self.planets = list(planets)
+        self.data = bytearray()
+        self.commands = []
+        self.turns = 0
+
+    def add_command(self, player_id: int, source: int, destination: int, ships: int):
+        self.commands.append((player_id, source, destination, ships))
+
+    def end_turn(self, turn: int, game_state: GameState):
+        data = self.data
+        data += count_record.pack(len(self.commands))
+        for command in self.commands:
+            data += command_record.pack(*command)
+        self.commands = []
+        self.turns = turn
+
+        if turn % self.keyframe_interval == 0:
+            for planet in game_state.planets:
+                data += planet_record.pack(planet.player_id, planet.ships)
+            data += fleets_record.pack(len(game_state.fleets), game_state.next_fleet_id)
+            for fleet in game_state.fleets:
+                data += fleet_record.pack(
+                    fleet.fleet_id,
+                    fleet.player_id,
+                    fleet.ships,
+                    fleet.source_planet,
+                    fleet.destination_planet,
+                    fleet.total_trip_length,
+                    fleet.turns_remaining,
+                )
+
+    def save(self, replay_file: str, result: GameResult):
+        header = {
+            "map_name": self.map_name,
+            "bot_1": result.bot_1.name,
+            "bot_2": result.bot_2.name,
+            "winning_player": result.winning_player,
+            "turns": self.turns,
+            "keyframe_interval": self.keyframe_interval,
+            "planets": len(self.planets),
+        }
+        temp_file = replay_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(magic)
+            f.write(json.dumps(header).encode() + b"\n")
+            for planet in self.planets:
+                f.write(MapStore.record.pack(*planet))
+            f.write(self.data)
+        os.replace(temp_file, replay_file)
+
+
+class Replay:
+    def __init__(self, header: dict, planets: list, commands: list, keyframes: dict):
+        self.map_name = header["map_name"]
+        self.bot_1_name = header["bot_1"]
+        self.bot_2_name = header["bot_2"]
+        self.winning_player = header["winning_player"]
+        self.turns = header["turns"]
+        self.keyframe_interval = header["keyframe_interval"]
+        # (x_pos, y_pos, player_id, ships, ship_growth) per planet, as in a map
+        self.planets = planets
+        # Accepted (player_id, source, destination, ships) commands, per turn
+        self.commands = commands
+        # Turn -> (planet (player_id, ships) list, fleet records, next fleet id)
+        self.keyframes = keyframes
+
+    def __str__(self):
+        return f"Replay:{self.bot_1_name}:{self.bot_2_name}:{self.map_name}"
+
+    @classmethod
+    def load(cls, replay_file: str):
+        with open(replay_file, "rb") as f:
+            if f.readline() != magic:
+                raise ValueError(f"{replay_file} is not an AutoPylot replay")
+            header = json.loads(f.readline())
+            data = f.read()
+
+        offset = 0
+
+        def read(record: struct.Struct, count: int = 1):
+            nonlocal offset
+            end = offset + record.size * count
+            if end > len(data):
+                raise ValueError(f"{replay_file} is truncated")
+            values = list(record.iter_unpack(data[offset:end]))
+            offset = end
+            return values
+
+        planets = read(MapStore.record, header["planets"])
+        commands = []
+        keyframes = {}
+        for turn in range(1, header["turns"] + 1):
+            (count,) = read(count_record)[0]
+            commands.append(read(command_record, count))
+            if turn % header["keyframe_interval"] == 0:
+                planet_states = read(planet_record, header["planets"])
+                fleet_count, next_fleet_id = read(fleets_record)[0]
+                keyframes[turn] = (
+                    planet_states,
+                    read(fleet_record, fleet_count),
+                    next_fleet_id,
+                )
+        return cls(header, planets, commands, keyframes)
+
+
+class ReplayPlayer:
+    # Plays a replay back through a GameController without calling the bots
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        self.controller = GameController()
+        self.restore(0)
+
+    def restore(self, turn: int):
+        # Rebuilds the controller's state from the map or the keyframe at turn
+        replay = self.replay
+        if turn:
+            planet_states, fleets, next_fleet_id = replay.keyframes[turn]
+        else:
+            planet_states = [planet[2:4] for planet in replay.planets]
+            fleets = []
+            next_fleet_id = 1
+
+        controller = self.controller
+        controller.game_state = GameState()
+        controller.snapshots = SnapshotCache()
+        controller.load_map(
+            replay.map_name,
+            [
+                (x_pos, y_pos, player_id, ships, ship_growth)
+                for (x_pos, y_pos, _, _, ship_growth), (player_id, ships) in zip(
+                    replay.planets, planet_states
+                )
+            ],
+        )
+        for (
+            fleet_id,
+            player_id,
+            ships,
+            source,
+            destination,
+            total_trip_length,
+            turns_remaining,
+        ) in fleets:
+            fleet = MovingFleet(
+                ships,
+                player_id,
+                source,
+                destination,
+                total_trip_length,
+                controller.game_state,
+            )
+            fleet.fleet_id = fleet_id
+            fleet.turns_remaining = turns_remaining
+            controller.game_state.add_fleet(fleet)
+        controller.game_state.next_fleet_id = next_fleet_id
+        # Snapshots the fleets just added
+        controller.snapshots.reset(controller.game_state)
+        controller.turn_count = turn
+
+    def step(self):
+        controller = self.controller
+        if controller.turn_count >= self.replay.turns:
+            return False
+
+        commands = {1: [], 2: []}
+        for player_id, source, destination, ships in self.replay.commands[
+            controller.turn_count
+        ]:
+            commands[player_id].append(FleetCommand(source, destination, ships))
+        controller.turn_count += 1
+        controller.play_turn(commands[1], commands[2])
+        return True
+
+    def seek(self, turn: int):
+        # Goes back to the last keyframe at or before turn unless turn is
+        # already within reach of the current turn, then plays forward to it
+        turn = max(0, min(turn, self.replay.turns))
+        keyframe_turn = turn - turn % self.replay.keyframe_interval
+        if not keyframe_turn <= self.controller.turn_count <= turn:
+            self.restore(keyframe_turn)
+        while self.controller.turn_count < turn:
+            self.step()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+from os import path
+
+from game_state import Bot, GameController, GameResult
+
+
+def get_game_seed(seed: int, bot_1: Bot, bot_2: Bot, map_file: str):
+    # Each game gets its own seed so a game's result doesn't depend on which
+    # worker played it or what that worker played before
+    digest = hashlib.sha256(
+        f"{seed}:{bot_1.name}:{bot_2.name}:{map_file}".encode()
+    ).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def get_file_digest(file_path: str):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ResultCache:
+    # Game results keyed by a hash of everything that decides a game: both
+    # bots' source, the map, the engine version, the seed and whether the
+    # bots ran in their own processes. Results are
+    # appended to cache_file as one JSON line per game, so an interrupted
+    # tournament keeps every game it finished
+    def __init__(self, cache_file: str, bot_path: str = "bots", map_path: str = "maps"):
+        self.cache_file = cache_file
+        self.bot_path = bot_path
+        self.map_path = map_path
+        self.results = {}
+        self.file_digests = {}
+        self.read()
+
+    def read(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Most likely the last line of a run that was killed
+                        continue
+                    self.results[entry["key"]] = (
+                        entry["winning_player"],
+                        entry["turn"],
+                    )
+        except OSError:
+            pass
+
+    def get_file_digest(self, file_path: str):
+        digest = self.file_digests.get(file_path)
+        if digest is None:
+            digest = get_file_digest(file_path)
+            self.file_digests[file_path] = digest
+        return digest
+
+    def get_key(
+        self, bot_1: Bot, bot_2: Bot, map_file: str, seed: int, isolate_bots=False
+    ):
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    self.get_file_digest(path.join(self.bot_path, bot_1.filename)),
+                    self.get_file_digest(path.join(self.bot_path, bot_2.filename)),
+                    self.get_file_digest(path.join(self.map_path, map_file)),
+                    GameController.engine_version,
+                    seed,
+                    # Isolated bots each have their own random module
+                    isolate_bots,
+                ]
+            ).encode()
+        ).hexdigest()
+
+    def get(self, key: str, bot_1: Bot, bot_2: Bot, map_file: str):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+
+        winning_player, turn = entry
+        # Copies, as the same Bot appears as player 1 in some jobs and 2 in others
+        bot_1, bot_2 = Bot(bot_1.filename), Bot(bot_2.filename)
+        bot_1.player_id, bot_2.player_id = 1, 2
+        return GameResult(
+            path.join(self.map_path, map_file),
+            bot_1,
+            bot_2,
+            winning_player,
+            turn,
+            cached=True,
+        )
+
+    def add(self, key: str, result: GameResult):
+        self.results[key] = (result.winning_player, result.turn)
+        with open(self.cache_file, "a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "key": key,
+                        "winning_player": result.winning_player,
+                        "turn": result.turn,
+                    }
+                )
+                + "\n"
+            )
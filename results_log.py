@@ -0,0 +1,147 @@
+import json
+import os
+from os import path
+
+from bot_timing import LatencyHistogram
+from game_state import Bot, GameResult
+from result_cache import ResultCache
+
+
+def read_lines(log_file: str):
+    # The complete lines of log_file, without a last line left half written
+    try:
+        with open(log_file, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    return data[: data.rfind(b"\n") + 1].decode().splitlines()
+
+
+def is_unfinished(log_file: str):
+    # Whether log_file holds results of a tournament that never got to the end
+    lines = read_lines(log_file)
+    return len(lines) > 1 and json.loads(lines[-1]) != {"finished": True}
+
+
+class ResultsLog(ResultCache):
+    # The results of one tournament, appended to log_file as one JSON line per
+    # game the moment it finishes and flushed to disk, so a tournament that
+    # crashes or is interrupted can be resumed without playing those games
+    # again. Each line names both bots and the map, with the winner, the turn
+    # count and what the summaries need, under the same key as the result
+    # cache so a game only counts as played while its inputs are unchanged.
+    # The first line holds the tournament settings, which a resumed
+    # tournament has to match, and a tournament that plays all its games ends
+    # the log with a finished line. Starting a new log over one that isn't
+    # finished needs overwrite, so its results aren't lost by accident
+    def __init__(
+        self,
+        log_file: str,
+        settings: dict,
+        resume: bool = False,
+        overwrite: bool = False,
+        bot_path: str = "bots",
+        map_path: str = "maps",
+    ):
+        self.settings = settings
+        # Number of results handed out by get, i.e. games that weren't replayed
+        self.resumed = 0
+        if not resume:
+            if not overwrite and is_unfinished(log_file):
+                raise ValueError(
+                    f"{log_file} holds the results of an unfinished tournament. "
+                    "Carry on with --resume, or start a new one with --overwrite"
+                )
+            with open(log_file, "w") as f:
+                f.write(json.dumps({"settings": settings}) + "\n")
+        super().__init__(log_file, bot_path, map_path)
+
+    def read(self):
+        try:
+            with open(self.cache_file, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+
+        # A run killed halfway through writing a line leaves part of it behind,
+        # which is cut off so the next result starts on a line of its own
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.cache_file, "r+b") as f:
+                f.truncate(end)
+        lines = data[:end].decode().splitlines()
+
+        if not lines:
+            self.write({"settings": self.settings})
+            return
+        settings = json.loads(lines[0]).get("settings")
+        if settings != self.settings:
+            raise ValueError(
+                f"{self.cache_file} was written by a tournament with different "
+                f"settings ({settings})"
+            )
+        for line in lines[1:]:
+            entry = json.loads(line)
+            if "key" in entry:
+                self.results[entry["key"]] = entry
+
+    def finish(self):
+        self.write({"finished": True})
+
+    def write(self, entry: dict):
+        with open(self.cache_file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def get(self, key: str, bot_1: Bot, bot_2: Bot, map_file: str):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+
+        self.resumed += 1
+        bot_1, bot_2 = Bot(entry["bot_1"]), Bot(entry["bot_2"])
+        bot_1.player_id, bot_2.player_id = 1, 2
+        bot_latency = {}
+        for player_id, fields in entry["bot_latency"].items():
+            histogram = LatencyHistogram()
+            vars(histogram).update(fields)
+            bot_latency[int(player_id)] = histogram
+        return GameResult(
+            path.join(self.map_path, entry["map"]),
+            bot_1,
+            bot_2,
+            entry["winning_player"],
+            entry["turn"],
+            bot_latency,
+            {int(player_id): count for player_id, count in entry["timeouts"].items()},
+            tuple(entry["forfeited_players"]),
+            command_errors={
+                int(player_id): reasons
+                for player_id, reasons in entry["command_errors"].items()
+            },
+            bot_errors={
+                int(player_id): reasons
+                for player_id, reasons in entry.get("bot_errors", {}).items()
+            },
+        )
+
+    def add(self, key: str, result: GameResult):
+        entry = {
+            "key": key,
+            "bot_1": result.bot_1.filename,
+            "bot_2": result.bot_2.filename,
+            "map": path.basename(result.map_name),
+            "winning_player": result.winning_player,
+            "turn": result.turn,
+            "forfeited_players": list(result.forfeited_players),
+            "timeouts": result.timeouts,
+            "command_errors": result.command_errors,
+            "bot_errors": result.bot_errors,
+            "bot_latency": {
+                player_id: vars(histogram)
+                for player_id, histogram in result.bot_latency.items()
+            },
+        }
+        self.results[key] = entry
+        self.write(entry)
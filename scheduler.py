@@ -0,0 +1,195 @@
+import math
+import random
+
+from game_state import Bot, GameResult
+
+
+def get_expected_score(elo: float):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def get_elo(score: float):
+    return -400 * math.log10(1 / score - 1)
+
+
+class Matchup:
+    # One pair of bots, played on a shuffled list of maps until a sequential
+    # probability ratio test (SPRT) decides which bot is stronger. Wins,
+    # losses and draws are from bot_1's side
+    def __init__(self, bot_1: Bot, bot_2: Bot, map_files: list, seed: int):
+        self.bot_1 = bot_1
+        self.bot_2 = bot_2
+        # Shuffled so the first games are a fair sample of every map
+        self.map_files = list(map_files)
+        random.Random(f"{seed}:{bot_1.name}:{bot_2.name}").shuffle(self.map_files)
+        self.next_map = 0
+        # Games handed out whose results haven't come back yet
+        self.in_flight = 0
+        self.wins = self.losses = self.draws = 0
+        # Player id of the stronger bot once decided, or 0 if every map was
+        # played without a decision
+        self.decision = None
+
+    def get_counts(self):
+        # Half a win, loss and draw are added so that a pair that has only won
+        # so far still has a finite score and Elo
+        return self.wins + 0.5, self.losses + 0.5, self.draws + 0.5
+
+    def get_score(self):
+        wins, losses, draws = self.get_counts()
+        return (wins + draws / 2) / (wins + losses + draws)
+
+    def get_llr(self, elo_margin: float):
+        # Exact log-likelihood ratio of bot_1 being elo_margin stronger rather
+        # than elo_margin weaker, with each game a Bernoulli trial of bot_1's
+        # score and a draw counted as half a win and half a loss. Unlike an
+        # estimate of the score's variance this holds for a handful of games,
+        # so the test keeps to its error rate even for lopsided pairs
+        score_0 = get_expected_score(-elo_margin)
+        score_1 = get_expected_score(elo_margin)
+        return (self.wins + self.draws / 2) * math.log(score_1 / score_0) + (
+            self.losses + self.draws / 2
+        ) * math.log((1 - score_1) / (1 - score_0))
+
+    def add_result(self, result: GameResult):
+        self.in_flight -= 1
+        if result.winning_player == 1:
+            self.wins += 1
+        elif result.winning_player == 2:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def get_games(self):
+        return self.wins + self.losses + self.draws
+
+    def __str__(self):
+        if self.decision == 1 or self.decision == 2:
+            names = self.bot_1.name, self.bot_2.name
+            stronger, weaker = names if self.decision == 1 else reversed(names)
+            outcome = f"{stronger} is stronger than {weaker}"
+        else:
+            outcome = f"{self.bot_1.name} and {self.bot_2.name} are too close to call"
+        return (
+            f"{outcome} after {self.get_games()} games "
+            f"({self.wins}-{self.losses}-{self.draws}, "
+            f"{get_elo(self.get_score()):+.0f} Elo for {self.bot_1.name})"
+        )
+
+
+class AdaptiveScheduler:
+    # Hands out games of every undecided pair as results come in, at most
+    # pair_games of one pair at a time, and stops playing a pair once an SPRT
+    # with error rate error decides which bot is at least elo_margin
+    # stronger. Clear matchups are decided in a few games, so the rest of the
+    # games go to the close ones
+    def __init__(
+        self,
+        pairs: list,
+        map_files: list,
+        pair_games: int = 4,
+        elo_margin: float = 50,
+        error: float = 0.05,
+        seed: int = 0,
+    ):
+        self.matchups = {
+            (bot_1.name, bot_2.name): Matchup(bot_1, bot_2, map_files, seed)
+            for bot_1, bot_2 in pairs
+        }
+        self.pair_games = pair_games
+        self.elo_margin = elo_margin
+        self.lower_bound = math.log(error / (1 - error))
+        self.upper_bound = math.log((1 - error) / error)
+
+    def get_jobs(self):
+        # Yields the next game of the undecided pair that has started the
+        # fewest games, or None while every such pair already has pair_games
+        # games being played. Ends once no undecided pair has maps left
+        while True:
+            matchups = [
+                matchup
+                for matchup in self.matchups.values()
+                if matchup.decision is None
+                and matchup.next_map < len(matchup.map_files)
+            ]
+            if not matchups:
+                return
+            matchups = [
+                matchup for matchup in matchups if matchup.in_flight < self.pair_games
+            ]
+            if not matchups:
+                yield None
+                continue
+
+            matchup = min(matchups, key=lambda matchup: matchup.next_map)
+            map_file = matchup.map_files[matchup.next_map]
+            matchup.next_map += 1
+            matchup.in_flight += 1
+            yield matchup.bot_1, matchup.bot_2, map_file
+
+    def add_result(self, result: GameResult):
+        matchup = self.matchups[result.bot_1.name, result.bot_2.name]
+        matchup.add_result(result)
+        if matchup.decision is not None:
+            # A game that was already being played when the pair was decided
+            return
+        llr = matchup.get_llr(self.elo_margin)
+        if llr >= self.upper_bound:
+            matchup.decision = 1
+        elif llr <= self.lower_bound:
+            matchup.decision = 2
+        elif matchup.next_map >= len(matchup.map_files) and not matchup.in_flight:
+            matchup.decision = 0
+
+    def run(self, run_games):
+        # run_games takes an iterator of jobs and yields their results, like
+        # tournament.run_tournament. Yields every result as it comes in
+        for result in run_games(self.get_jobs()):
+            self.add_result(result)
+            yield result
+
+    def get_ratings(self, iterations: int = 100):
+        # Bradley-Terry ratings fitted to every game played, as Elo with an
+        # average of 0, highest first. Like Matchup.get_counts, each pair also
+        # gets one extra draw so that a bot that never lost still has a rating
+        names = sorted({name for pair in self.matchups for name in pair})
+        scores = dict.fromkeys(names, 0.0)
+        games = {}
+        for (name_1, name_2), matchup in self.matchups.items():
+            wins, losses, draws = matchup.get_counts()
+            scores[name_1] += wins + draws / 2
+            scores[name_2] += losses + draws / 2
+            pair_games = wins + losses + draws
+            games.setdefault(name_1, {})[name_2] = pair_games
+            games.setdefault(name_2, {})[name_1] = pair_games
+
+        strengths = dict.fromkeys(names, 1.0)
+        for _ in range(iterations):
+            strengths = {
+                name: scores[name]
+                / sum(
+                    pair_games / (strengths[name] + strengths[opponent])
+                    for opponent, pair_games in games[name].items()
+                )
+                for name in names
+            }
+            # Scaled so the geometric mean strength is 1, i.e. the mean Elo is 0
+            scale = math.exp(
+                sum(math.log(strength) for strength in strengths.values()) / len(names)
+            )
+            strengths = {name: strength / scale for name, strength in strengths.items()}
+
+        return sorted(
+            (
+                (name, 400 * math.log10(strength))
+                for name, strength in strengths.items()
+            ),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+    def get_games_played(self):
+        return sum(matchup.get_games() for matchup in self.matchups.values())
+
+    def get_games_possible(self):
+        return sum(len(matchup.map_files) for matchup in self.matchups.values())
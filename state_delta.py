@@ -0,0 +1,186 @@
+from types import MappingProxyType
+
+from game_state import (
+    Fleet,
+    FleetSnapshot,
+    GameState,
+    PlanetSnapshot,
+    index_incoming_fleets,
+)
+
+
+class StateDeltaEncoder:
+    # Engine side of the turn protocol. The first message of a game carries the
+    # map, and every message after that only what changed since the previous
+    # one: planets whose owner or ship count changed in a way other than
+    # growth, and fleets launched since. Owned planets grow by the same amount
+    # every turn, and fleets only ever move one turn at a time and land when
+    # they run out of turns, so the mirror grows the planets and moves and
+    # lands the fleets itself. The encoder predicts the mirror's growth the
+    # same way, so only landings, launches and captures are sent
+    def __init__(self):
+        self.sent_planets = None
+        self.ship_growth = None
+        self.sent_turn = None
+        self.sent_next_fleet_id = 1
+
+    def encode(self, turn: int, game_state: GameState):
+        messages = []
+        if self.sent_planets is None:
+            planets = tuple(PlanetSnapshot.of(planet) for planet in game_state.planets)
+            messages.append(
+                (
+                    "map",
+                    turn,
+                    planets,
+                    dict(game_state.planet_positions),
+                    {
+                        source: dict(destinations)
+                        for source, destinations in game_state.trip_lengths.items()
+                    },
+                )
+            )
+            self.sent_planets = [(planet.player_id, planet.ships) for planet in planets]
+            self.ship_growth = [planet.ship_growth for planet in planets]
+            self.sent_turn = turn
+
+        planet_changes = []
+        turns = turn - self.sent_turn
+        for position, planet in enumerate(game_state.planets):
+            player_id, ships = self.sent_planets[position]
+            if player_id != 0:
+                # What the mirror will have grown the planet to
+                ships += self.ship_growth[position] * turns
+            values = planet.player_id, planet.ships
+            if (player_id, ships) != values:
+                planet_changes.append((position, *values))
+            self.sent_planets[position] = values
+        self.sent_turn = turn
+
+        # Fleets are kept in launch order, so the new ones are at the end
+        launched_fleets = []
+        fleets = game_state.fleets
+        index = len(fleets) - 1
+        while index >= 0 and fleets[index].fleet_id >= self.sent_next_fleet_id:
+            fleet = fleets[index]
+            launched_fleets.append(
+                (
+                    fleet.fleet_id,
+                    fleet.player_id,
+                    fleet.ships,
+                    fleet.source_planet,
+                    fleet.destination_planet,
+                    fleet.total_trip_length,
+                    fleet.turns_remaining,
+                )
+            )
+            index -= 1
+        launched_fleets.reverse()
+        self.sent_next_fleet_id = game_state.next_fleet_id
+
+        messages.append(
+            (
+                "turn",
+                turn,
+                planet_changes,
+                launched_fleets,
+                game_state.next_fleet_id,
+                (
+                    tuple(game_state.planet_ships),
+                    tuple(game_state.fleet_ships),
+                    tuple(game_state.planet_counts),
+                ),
+                game_state.current_player,
+            )
+        )
+        return messages
+
+
+class GameStateMirror:
+    # Bot side of the turn protocol, which keeps a copy of the engine's state
+    # up to date from the messages of a StateDeltaEncoder
+    def __init__(self):
+        self.planets = []
+        self.planet_positions = None
+        self.trip_lengths = None
+        self.fleets = []
+        self.turn = 1
+
+    def apply(self, message):
+        # Returns the bot's read-only GameState after a "turn" message
+        if message[0] == "map":
+            _, self.turn, planets, planet_positions, trip_lengths = message
+            self.planets = list(planets)
+            self.planet_positions = MappingProxyType(planet_positions)
+            self.trip_lengths = MappingProxyType(
+                {
+                    source: MappingProxyType(destinations)
+                    for source, destinations in trip_lengths.items()
+                }
+            )
+            return None
+
+        (
+            _,
+            turn,
+            planet_changes,
+            launched_fleets,
+            next_fleet_id,
+            totals,
+            current_player,
+        ) = message
+
+        # Growth first, as the changes are the planets that didn't just grow
+        turns = turn - self.turn
+        for position, planet in enumerate(self.planets):
+            if planet.player_id != 0 and planet.ship_growth and turns:
+                planet = PlanetSnapshot.of(planet)
+                planet.__dict__["ships"] += planet.ship_growth * turns
+                self.planets[position] = planet
+        for position, player_id, ships in planet_changes:
+            planet = PlanetSnapshot.of(self.planets[position])
+            planet.__dict__.update(player_id=player_id, ships=ships)
+            self.planets[position] = planet
+
+        # Same arithmetic as GameController.move_fleets, once for every turn
+        # since the last message, so the trip lengths match the engine's exactly
+        for fleet in self.fleets:
+            for _ in range(turn - self.turn):
+                fleet.turns_remaining -= 1
+        self.fleets = [fleet for fleet in self.fleets if fleet.turns_remaining > 0]
+        for (
+            fleet_id,
+            player_id,
+            ships,
+            source_planet,
+            destination_planet,
+            total_trip_length,
+            turns_remaining,
+        ) in launched_fleets:
+            fleet = Fleet(
+                ships, player_id, source_planet, destination_planet, total_trip_length
+            )
+            fleet.fleet_id = fleet_id
+            fleet.turns_remaining = turns_remaining
+            self.fleets.append(fleet)
+        self.turn = turn
+
+        state = GameState()
+        state.planets = list(self.planets)
+        state.fleets = [FleetSnapshot.of(fleet) for fleet in self.fleets]
+        state.planet_positions = self.planet_positions
+        state.planet_index = MappingProxyType(
+            {planet.planet_id: planet for planet in state.planets}
+        )
+        state.fleet_index = MappingProxyType(
+            {fleet.fleet_id: fleet for fleet in state.fleets}
+        )
+        state.incoming_fleets, state.incoming_ships = index_incoming_fleets(
+            state.fleets
+        )
+        state.trip_lengths = self.trip_lengths
+        state.planet_ships, state.fleet_ships, state.planet_counts = totals
+        state.next_fleet_id = next_fleet_id
+        state.current_player = current_player
+        state.enemy_player = 2 if current_player == 1 else 1
+        return state
@@ -0,0 +1,755 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from fnmatch import fnmatch
+from functools import partial
+import os
+from os import path
+import random
+import sys
+from time import time
+
+from array_engine import ArrayGameController
+from bot_timing import LatencyHistogram, TimeBudget
+from distributed import (
+    Coordinator,
+    NoWorkersError,
+    authkey_variable,
+    parse_address,
+    read_authkey,
+)
+from game_state import Bot, GameController, GameResult, load_bot_module
+from instrumentation import Metrics
+from map_store import MapStore
+from replay import ReplayRecorder
+from result_cache import ResultCache, get_game_seed
+from results_log import ResultsLog
+from scheduler import AdaptiveScheduler
+
+engines = {"objects": GameController, "arrays": ArrayGameController}
+
+
+def get_bot_files(bot_path: str = "bots"):
+    return sorted(
+        file
+        for file in os.listdir(bot_path)
+        if path.isfile(path.join(bot_path, file)) and file.endswith(".py")
+    )
+
+
+def filter_names(names: list, patterns: list, suffix: str):
+    if not patterns:
+        return names
+
+    return [
+        name
+        for name in names
+        if any(
+            fnmatch(name, pattern) or fnmatch(name, pattern + suffix)
+            for pattern in patterns
+        )
+    ]
+
+
+def get_round_robin_pairs(bots: list):
+    return [
+        (x, y)
+        for x_idx, x in enumerate(bots)
+        for y_idx, y in enumerate(bots)
+        if x_idx < y_idx
+    ]
+
+
+def get_gauntlet_pairs(challenger: Bot, bots: list):
+    return [(challenger, bot) for bot in bots if bot.name != challenger.name]
+
+
+def get_jobs(pairs: list, map_files: list):
+    return [
+        (bot_1, bot_2, map_file) for bot_1, bot_2 in pairs for map_file in map_files
+    ]
+
+
+# Maps parsed once by the parent process and handed to each worker on startup
+worker_map_store = None
+
+
+def init_worker(map_store: MapStore, bot_module_names: list):
+    # Runs once per worker, which then stays alive for every match it plays,
+    # so maps and bot modules are only loaded once per worker
+    global worker_map_store
+    worker_map_store = map_store
+    for module_name in bot_module_names:
+        load_bot_module(module_name)
+
+
+def get_replay_file(replay_path: str, bot_1: Bot, bot_2: Bot, map_file: str):
+    map_name = path.splitext(map_file)[0]
+    return path.join(replay_path, f"{bot_1.name}-{bot_2.name}-{map_name}.replay")
+
+
+def autoplay_map(
+    args,
+    controller_class=GameController,
+    time_budget=None,
+    replay_path=None,
+    seed=None,
+    isolate_bots=False,
+    metrics=False,
+):
+    bot_1 = args[0]
+    bot_2 = args[1]
+    map_file = args[2]
+    if seed is not None:
+        # Makes bots that use the random module play the same game every time
+        random.seed(get_game_seed(seed, bot_1, bot_2, map_file))
+    controller = controller_class(worker_map_store, time_budget, isolate_bots)
+    if replay_path:
+        controller.replay = ReplayRecorder()
+    if metrics:
+        # Sent back to the parent with the game's result
+        controller.metrics = Metrics()
+    # Rejected commands and bot errors are only counted, and summarised by
+    # the parent
+    controller.command_errors.report_limit = 0
+    controller.bot_errors.report_limit = 0
+    controller.start_game(bot_1, bot_2)
+
+    controller.load_map_file("maps/" + map_file)
+
+    while True:
+        controller.turn_step()
+        result = controller.get_game_result()
+        if result:
+            if replay_path:
+                controller.replay.save(
+                    get_replay_file(replay_path, bot_1, bot_2, map_file), result
+                )
+            return result
+
+
+def run_tournament(
+    jobs,
+    workers: int = None,
+    controller_class=GameController,
+    map_store: MapStore = None,
+    time_budget: TimeBudget = None,
+    replay_path: str = None,
+    seed: int = None,
+    result_cache: ResultCache = None,
+    isolate_bots: bool = False,
+    metrics: bool = False,
+    coordinator: Coordinator = None,
+    results_log: ResultsLog = None,
+    bots: list = None,
+):
+    # Results are yielded in the order games finish, not the order of the jobs.
+    # jobs can be a list or an iterator, which is only read as there is room
+    # for more games. An iterator can also yield None when its next job
+    # depends on the results still to come, and is read again after the next
+    # result. bots are loaded by every worker up front, and default to the
+    # bots in jobs when it's a list.
+    # With a replay_path every game is also saved there as a replay.
+    # Games found in the result_cache are yielded without being played.
+    # Games with a time budget depend on timing, and replays need the game to
+    # be played, so neither is read from or added to the cache. With metrics
+    # every game that is played has its turns instrumented. With a
+    # coordinator the games are played by its remote workers instead of a
+    # local pool. Every result is added to the results_log as soon as it
+    # comes in, and games already in the log are yielded without being played
+    if time_budget is not None or replay_path:
+        result_cache = None
+    key_store = results_log if results_log is not None else result_cache
+
+    settings = dict(
+        controller_class=controller_class,
+        time_budget=time_budget,
+        replay_path=replay_path,
+        seed=seed,
+        isolate_bots=isolate_bots,
+        metrics=metrics,
+    )
+    if coordinator is not None:
+        pool = coordinator
+    else:
+        if bots is None and isinstance(jobs, list):
+            bots = [bot for bot_1, bot_2, map_file in jobs for bot in (bot_1, bot_2)]
+        pool = LocalPool(workers, map_store, bots, replay_path)
+
+    jobs = iter(jobs)
+    jobs_left = True
+    # (bot_1 name, bot_2 name, map file) -> cache key of every game being played
+    playing = {}
+    try:
+        while True:
+            while jobs_left and len(playing) < pool.get_capacity():
+                job = next(jobs, False)
+                if job is False:
+                    jobs_left = False
+                    break
+                if job is None:
+                    break
+
+                bot_1, bot_2, map_file = job
+                key = None
+                if key_store is not None:
+                    key = key_store.get_key(bot_1, bot_2, map_file, seed, isolate_bots)
+                    result = None
+                    if results_log is not None:
+                        result = results_log.get(key, bot_1, bot_2, map_file)
+                    if result is None and result_cache is not None:
+                        result = result_cache.get(key, bot_1, bot_2, map_file)
+                        if result is not None and results_log is not None:
+                            results_log.add(key, result)
+                    if result is not None:
+                        yield result
+                        continue
+                playing[bot_1.name, bot_2.name, map_file] = key
+                pool.add_job(job, settings)
+
+            # Nothing left to play, or jobs waiting on results that will never
+            # come
+            if not playing:
+                return
+
+            result = pool.get_result()
+            if result is None:
+                continue
+            key = playing.pop(
+                (result.bot_1.name, result.bot_2.name, path.basename(result.map_name))
+            )
+            if results_log is not None:
+                results_log.add(key, result)
+            if result_cache is not None:
+                result_cache.add(key, result)
+            yield result
+    finally:
+        # The coordinator outlives the tournament, and is closed by its owner
+        if coordinator is None:
+            pool.close()
+
+
+class LocalPool:
+    # Plays games in worker processes on this machine, the same way a
+    # distributed.Coordinator has them played by remote workers. The workers
+    # are only started once there is a game to play, and stay up until close
+    def __init__(
+        self, workers: int, map_store: MapStore, bots: list, replay_path: str = None
+    ):
+        self.workers = workers or os.cpu_count()
+        self.map_store = map_store
+        self.bot_module_names = sorted({bot.module_name for bot in bots or ()})
+        self.replay_path = replay_path
+        self.executor = None
+        self.futures = set()
+        self.done = set()
+
+    def start(self):
+        if self.map_store is None:
+            self.map_store = MapStore.from_files("maps")
+        # Loading the bots in the parent first means forked workers inherit them
+        for module_name in self.bot_module_names:
+            load_bot_module(module_name)
+
+        if self.replay_path:
+            os.makedirs(self.replay_path, exist_ok=True)
+
+        # Unlike a multiprocessing Pool, the executor's workers aren't daemonic
+        # and so can start a process for each bot when isolate_bots is set
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_worker,
+            initargs=(self.map_store, self.bot_module_names),
+        )
+
+    def get_capacity(self):
+        # Only one game per worker is handed out at a time, so stopping early
+        # doesn't leave the rest of the tournament queued
+        return self.workers
+
+    def add_job(self, job, settings: dict):
+        if self.executor is None:
+            self.start()
+        self.futures.add(self.executor.submit(autoplay_map, job, **settings))
+
+    def get_result(self):
+        if not self.done:
+            self.done, self.futures = wait(self.futures, return_when=FIRST_COMPLETED)
+        return self.done.pop().result()
+
+    def close(self):
+        # After Ctrl-C, a bot exception or the caller stopping early, the
+        # queued games are dropped instead of played and thrown away, and
+        # only the games already running are waited for
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+class ProgressLine:
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.turns = 0
+        self.start_time = time()
+        self.last_write = 0
+        self.is_tty = stream.isatty()
+
+    def update(self, result: GameResult):
+        self.done += 1
+        self.turns += result.turn
+
+        now = time()
+        # Pipes and CI logs get at most one line per second instead of a redraw per game
+        if not self.is_tty and now - self.last_write < 1 and self.done < self.total:
+            return
+        self.last_write = now
+
+        elapsed = max(now - self.start_time, 1e-9)
+        games_per_sec = self.done / elapsed
+        remaining = (self.total - self.done) / games_per_sec
+        line = (
+            f"[{self.done}/{self.total}] "
+            f"{games_per_sec:.1f} games/s {self.turns / elapsed:.0f} turns/s "
+            f"elapsed {elapsed:.1f}s eta {remaining:.1f}s"
+        )
+        self.stream.write("\r" + line if self.is_tty else line + "\n")
+        self.stream.flush()
+
+    def clear(self):
+        if self.is_tty:
+            self.stream.write("\r\033[K")
+
+    def finish(self):
+        if self.is_tty:
+            self.stream.write("\n")
+        self.stream.flush()
+
+
+def summarise(results: list, bots: list):
+    lines = []
+    for bot in bots:
+        win_count = lose_count = draw_count = 0
+        for result in results:
+            if bot.name not in (result.bot_1.name, result.bot_2.name):
+                continue
+            if result.winning_player == 0:
+                draw_count += 1
+            elif result.get_winning_bot().name == bot.name:
+                win_count += 1
+            else:
+                lose_count += 1
+
+        lines.append(
+            f"{bot.name} won {win_count} games and lost {lose_count} games (drew {draw_count} games)"
+        )
+    return lines
+
+
+def summarise_latency(results: list):
+    # Per bot latency over every game it played, slowest bots first
+    latency = {}
+    timeouts = {}
+    for result in results:
+        for player_id, bot in ((1, result.bot_1), (2, result.bot_2)):
+            if player_id not in result.bot_latency:
+                continue
+            latency.setdefault(bot.name, LatencyHistogram()).merge(
+                result.bot_latency[player_id]
+            )
+            timeouts[bot.name] = timeouts.get(bot.name, 0) + result.timeouts.get(
+                player_id, 0
+            )
+
+    return [
+        f"{name}: {histogram} ({timeouts[name]} overruns)"
+        for name, histogram in sorted(
+            latency.items(), key=lambda item: item[1].total, reverse=True
+        )
+    ]
+
+
+def summarise_errors(results: list, kind: str = "command_errors"):
+    # Rejected commands, or with kind "bot_errors" exceptions and stopped
+    # processes, per bot over every game it played, most first
+    errors = {}
+    for result in results:
+        for player_id, bot in ((1, result.bot_1), (2, result.bot_2)):
+            for reason, count in getattr(result, kind).get(player_id, {}).items():
+                bot_errors = errors.setdefault(bot.name, {})
+                bot_errors[reason] = bot_errors.get(reason, 0) + count
+
+    return [
+        f"{name}: {sum(reasons.values())} ("
+        + ", ".join(
+            f"{reason} {count}"
+            for reason, count in sorted(
+                reasons.items(), key=lambda item: item[1], reverse=True
+            )
+        )
+        + ")"
+        for name, reasons in sorted(
+            errors.items(), key=lambda item: sum(item[1].values()), reverse=True
+        )
+    ]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play AutoPylot bots against each other without the GUI"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of worker processes (default: all cores)",
+    )
+    parser.add_argument(
+        "--maps",
+        nargs="+",
+        metavar="MAP",
+        help="map names or glob patterns to play on (default: all maps)",
+    )
+    parser.add_argument(
+        "--bots",
+        nargs="+",
+        metavar="BOT",
+        help="bot names or glob patterns to include (default: all bots)",
+    )
+    parser.add_argument(
+        "--gauntlet",
+        metavar="BOT",
+        help="play this bot against every other bot instead of a round robin",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=sorted(engines),
+        default="objects",
+        help="simulation backend (arrays requires numpy)",
+    )
+    parser.add_argument(
+        "--map-cache",
+        default="maps.cache",
+        metavar="FILE",
+        help="compiled map cache, rebuilt whenever a map changes (default: maps.cache)",
+    )
+    parser.add_argument(
+        "--no-map-cache",
+        action="store_true",
+        help="parse the maps without reading or writing the map cache",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="stop playing a pair once a sequential test decides which bot is "
+        "stronger, instead of playing every map",
+    )
+    parser.add_argument(
+        "--pair-games",
+        type=int,
+        default=4,
+        help="most games of one undecided --adaptive pair played at once (default: 4)",
+    )
+    parser.add_argument(
+        "--elo-margin",
+        type=float,
+        default=50,
+        help="Elo difference the --adaptive test tells apart (default: 50)",
+    )
+    parser.add_argument(
+        "--sprt-error",
+        type=float,
+        default=0.05,
+        help="chance the --adaptive test picks the wrong bot (default: 0.05)",
+    )
+    parser.add_argument(
+        "--turn-budget",
+        type=float,
+        metavar="SECONDS",
+        help="time each bot may take per turn (default: unlimited)",
+    )
+    parser.add_argument(
+        "--game-budget",
+        type=float,
+        metavar="SECONDS",
+        help="total time each bot may take per game (default: unlimited)",
+    )
+    parser.add_argument(
+        "--overrun",
+        choices=TimeBudget.policies,
+        default="skip",
+        help="what happens to a bot that overruns its budget (default: skip the turn)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="seed for bots that use the random module, so games can be repeated (default: 0)",
+    )
+    parser.add_argument(
+        "--result-cache",
+        default="results.cache",
+        metavar="FILE",
+        help="cache of game results, so only games whose bots or map changed are played "
+        "(default: results.cache)",
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="play every game without reading or writing the result cache",
+    )
+    parser.add_argument(
+        "--results-log",
+        default="results.log",
+        metavar="FILE",
+        help="file every result is saved to as soon as its game ends, to --resume "
+        "from (default: results.log)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="carry on the tournament in --results-log instead of starting a new "
+        "one, only playing the games it doesn't have",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="start a new --results-log even if it holds an unfinished tournament",
+    )
+    parser.add_argument(
+        "--no-results-log",
+        action="store_true",
+        help="don't save the results as they come in",
+    )
+    parser.add_argument(
+        "--isolate-bots",
+        action="store_true",
+        help="run each bot in its own process, so both bots think at the same time "
+        "and a crashing bot only forfeits its game",
+    )
+    parser.add_argument(
+        "--replays",
+        metavar="DIR",
+        help="save a replay of every game to this directory, to watch in the GUI",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="time and count each phase of every turn played and write the totals "
+        "to this file",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=("json", "prometheus"),
+        default="json",
+        help="format of the --metrics file (default: json)",
+    )
+    parser.add_argument(
+        "--coordinator",
+        metavar="HOST:PORT",
+        help="listen on this address and let distributed.py workers on other "
+        "machines play the games instead of local worker processes",
+    )
+    parser.add_argument(
+        "--authkey-file",
+        metavar="FILE",
+        help="file holding the secret workers need to connect to --coordinator "
+        f"(default: the {authkey_variable} environment variable)",
+    )
+    parser.add_argument(
+        "--worker-timeout",
+        type=float,
+        default=300,
+        metavar="SECONDS",
+        help="give up when no --coordinator workers are connected for this long "
+        "(default: 300)",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="only print the progress line and the final summary",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    map_store = MapStore.load("maps", None if args.no_map_cache else args.map_cache)
+    map_files = filter_names(map_store.get_map_names(), args.maps, ".txt")
+    bots = [Bot(file) for file in filter_names(get_bot_files("bots"), args.bots, ".py")]
+
+    if args.gauntlet:
+        challenger = Bot(
+            args.gauntlet if args.gauntlet.endswith(".py") else args.gauntlet + ".py"
+        )
+        if not path.isfile(path.join("bots", challenger.filename)):
+            sys.exit(f"Unknown bot {args.gauntlet}")
+        pairs = get_gauntlet_pairs(challenger, bots)
+        bots = [challenger] + [bot for bot in bots if bot.name != challenger.name]
+    else:
+        pairs = get_round_robin_pairs(bots)
+
+    jobs = get_jobs(pairs, map_files)
+    if not jobs:
+        sys.exit("No games to play (check the --maps and --bots filters)")
+
+    time_budget = None
+    if args.turn_budget is not None or args.game_budget is not None:
+        time_budget = TimeBudget(args.turn_budget, args.game_budget, args.overrun)
+
+    result_cache = None if args.no_result_cache else ResultCache(args.result_cache)
+
+    results_log = None
+    if args.resume and args.no_results_log:
+        sys.exit("--resume can't be used with --no-results-log")
+    if not args.no_results_log:
+        settings = {
+            "seed": args.seed,
+            "isolate_bots": args.isolate_bots,
+            "turn_budget": args.turn_budget,
+            "game_budget": args.game_budget,
+            "overrun": args.overrun,
+        }
+        try:
+            results_log = ResultsLog(
+                args.results_log, settings, args.resume, args.overwrite
+            )
+        except ValueError as e:
+            sys.exit(str(e))
+
+    coordinator = None
+    if args.coordinator:
+        if args.replays:
+            sys.exit("Replays can't be saved when the games are played by workers")
+        try:
+            authkey = read_authkey(args.authkey_file)
+        except (OSError, ValueError) as e:
+            sys.exit(str(e))
+        coordinator = Coordinator(
+            parse_address(args.coordinator),
+            authkey,
+            worker_timeout=args.worker_timeout,
+        )
+        coordinator.start()
+        print(f"Waiting for workers on {args.coordinator}", file=sys.stderr)
+
+    run_games = partial(
+        run_tournament,
+        workers=args.workers,
+        controller_class=engines[args.engine],
+        map_store=map_store,
+        time_budget=time_budget,
+        replay_path=args.replays,
+        seed=args.seed,
+        result_cache=result_cache,
+        isolate_bots=args.isolate_bots,
+        metrics=args.metrics is not None,
+        coordinator=coordinator,
+        results_log=results_log,
+        bots=bots,
+    )
+    scheduler = None
+    if args.adaptive:
+        scheduler = AdaptiveScheduler(
+            pairs,
+            map_files,
+            args.pair_games,
+            args.elo_margin,
+            args.sprt_error,
+            args.seed,
+        )
+        games = scheduler.run(run_games)
+    else:
+        games = run_games(jobs)
+
+    # With --adaptive the total is only an upper bound
+    progress = ProgressLine(len(jobs))
+    results = []
+    try:
+        for result in games:
+            results.append(result)
+            if not args.quiet:
+                progress.clear()
+                print(result, flush=True)
+            progress.update(result)
+    except KeyboardInterrupt:
+        if results_log is None:
+            raise
+        progress.finish()
+        sys.exit(
+            f"Interrupted after {len(results)} games. Run the same command with "
+            f"--resume to play the rest"
+        )
+    except NoWorkersError as e:
+        progress.finish()
+        sys.exit(str(e))
+    except Exception:
+        if results_log is not None:
+            progress.finish()
+            print(
+                f"Stopped after {len(results)} games, which are saved in "
+                f"{args.results_log}. Run the same command with --resume to play "
+                f"the rest",
+                file=sys.stderr,
+            )
+        raise
+    finally:
+        # Stops the games still queued when the tournament ends early
+        games.close()
+        if coordinator is not None:
+            # Lets the workers know there is nothing left to play
+            coordinator.close()
+    progress.finish()
+    if results_log is not None:
+        results_log.finish()
+
+    for line in summarise(results, bots):
+        print(line)
+
+    if scheduler is not None:
+        for matchup in scheduler.matchups.values():
+            print(matchup)
+        print(
+            f"Played {scheduler.get_games_played()} of "
+            f"{scheduler.get_games_possible()} games. Elo ratings:"
+        )
+        for name, elo in scheduler.get_ratings():
+            print(f"  {name}: {elo:+.0f}")
+
+    if results_log is not None and results_log.resumed:
+        print(f"{results_log.resumed} results came from {args.results_log}")
+    cached_count = sum(result.cached for result in results)
+    if cached_count:
+        print(f"{cached_count} of {len(results)} results came from {args.result_cache}")
+
+    print("Bot thinking time per turn:")
+    for line in summarise_latency(results):
+        print("  " + line)
+
+    command_error_lines = summarise_errors(results)
+    if command_error_lines:
+        print("Invalid commands:")
+        for line in command_error_lines:
+            print("  " + line)
+
+    bot_error_lines = summarise_errors(results, "bot_errors")
+    if bot_error_lines:
+        print("Bot errors:")
+        for line in bot_error_lines:
+            print("  " + line)
+
+    if args.metrics:
+        metrics = Metrics()
+        for result in results:
+            if result.metrics is not None:
+                metrics.merge(result.metrics)
+        with open(args.metrics, "w") as f:
+            f.write(
+                metrics.to_prometheus()
+                if args.metrics_format == "prometheus"
+                else metrics.to_json()
+            )
+
+
+if __name__ == "__main__":
+    main()
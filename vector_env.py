@@ -0,0 +1,316 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from array_engine import FleetArrays, resolve_landings
+from game_state import (
+    FleetCommand,
+    FleetSnapshot,
+    GameController,
+    GameResult,
+    GameState,
+    PlanetSnapshot,
+    SleepHint,
+)
+
+
+class GameFleetArrays(FleetArrays):
+    # FleetArrays for many games at once, with each fleet tagged by its game
+    columns = FleetArrays.columns + ("game",)
+
+    def append(
+        self,
+        fleet_id: int,
+        player_id: int,
+        ships: int,
+        source: int,
+        destination: int,
+        trip_length: float,
+        game: int,
+    ):
+        super().append(fleet_id, player_id, ships, source, destination, trip_length)
+        self.game[self.count - 1] = game
+
+
+class VectorGameEnv:
+    # Plays N independent games in lockstep, holding every game's planets in
+    # (games, planets) arrays and every fleet in one set of fleet arrays, so a
+    # single step advances all of them with the same rules as GameController.
+    # Each game is (map_file, bot_1, bot_2); the bots can be None when the
+    # commands come from outside, e.g. from an agent being trained
+    turn_limit = GameController.turn_limit
+
+    def __init__(self, games: list, map_store=None):
+        if np is None:
+            raise ImportError("VectorGameEnv requires numpy")
+
+        self.games = games
+        self.loaded_states = []
+        self.get_commands = []
+        for map_file, bot_1, bot_2 in games:
+            controller = GameController(map_store)
+            controller.game_state = GameState()
+            controller.load_map_file(map_file)
+            self.loaded_states.append(controller.game_state)
+            if bot_1 and bot_2:
+                bot_1.player_id, bot_2.player_id = 1, 2
+                self.get_commands.append(
+                    (bot_1.get_module().get_commands, bot_2.get_module().get_commands)
+                )
+            else:
+                self.get_commands.append(None)
+
+        game_count = len(games)
+        max_planets = max(len(state.planets) for state in self.loaded_states)
+        self.planet_count = np.zeros(game_count, dtype=np.int64)
+        self.initial_owner = np.zeros((game_count, max_planets), dtype=np.int64)
+        self.initial_ships = np.zeros((game_count, max_planets), dtype=np.int64)
+        self.growth = np.zeros((game_count, max_planets), dtype=np.int64)
+        self.trip_lengths = np.zeros(
+            (game_count, max_planets, max_planets), dtype=np.float64
+        )
+        # Padding planets are neutral with no ships or growth, so they never
+        # change and never count towards anyone's totals
+        for game, state in enumerate(self.loaded_states):
+            planets = state.get_planets()
+            self.planet_count[game] = len(planets)
+            for position, planet in enumerate(planets):
+                self.initial_owner[game, position] = planet.player_id
+                self.initial_ships[game, position] = planet.ships
+                self.growth[game, position] = planet.ship_growth
+                for destination, other in enumerate(planets):
+                    self.trip_lengths[game, position, destination] = (
+                        state.get_trip_length(planet.planet_id, other.planet_id)
+                    )
+
+        self.owner = self.initial_owner.copy()
+        self.ships = self.initial_ships.copy()
+        self.fleets = GameFleetArrays()
+        self.turn_count = np.zeros(game_count, dtype=np.int64)
+        self.next_fleet_id = np.ones(game_count, dtype=np.int64)
+        self.done = np.zeros(game_count, dtype=bool)
+        self.winning_player = np.zeros(game_count, dtype=np.int64)
+        self.invalid_commands = np.zeros((game_count, 3), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.games)
+
+    def reset(self, games=None):
+        games = np.arange(len(self)) if games is None else np.asarray(games)
+        self.owner[games] = self.initial_owner[games]
+        self.ships[games] = self.initial_ships[games]
+        self.turn_count[games] = 0
+        self.next_fleet_id[games] = 1
+        self.done[games] = False
+        self.winning_player[games] = 0
+        self.invalid_commands[games] = 0
+
+        fleets = self.fleets
+        reset = np.zeros(len(self), dtype=bool)
+        reset[games] = True
+        fleets.keep(~reset[fleets.game[: fleets.count]])
+
+    def get_player_totals(self):
+        # (games, 3) array of ships on planets and in flight, indexed by player id
+        fleets = self.fleets
+        count = fleets.count
+        totals = np.zeros((len(self), 3), dtype=np.int64)
+        for player_id in (1, 2):
+            totals[:, player_id] = np.where(self.owner == player_id, self.ships, 0).sum(
+                axis=1
+            )
+        totals += (
+            np.bincount(
+                fleets.game[:count] * 3 + fleets.player_id[:count],
+                fleets.ships[:count],
+                minlength=3 * len(self),
+            )
+            .astype(np.int64)
+            .reshape(len(self), 3)
+        )
+        return totals
+
+    def get_game_state(self, game: int, current_player: int):
+        # Read-only GameState for one game, in the same form bots get from
+        # GameController.copy_game_state
+        loaded_state = self.loaded_states[game]
+        planet_count = self.planet_count[game]
+        planets = []
+        for planet, player_id, ships in zip(
+            loaded_state.planets,
+            self.owner[game, :planet_count].tolist(),
+            self.ships[game, :planet_count].tolist(),
+        ):
+            snapshot = object.__new__(PlanetSnapshot)
+            snapshot.__dict__.update(planet.__dict__)
+            snapshot.__dict__.update(player_id=player_id, ships=ships)
+            planets.append(snapshot)
+
+        fleets = []
+        count = self.fleets.count
+        in_game = np.flatnonzero(self.fleets.game[:count] == game)
+        for values in zip(
+            *(
+                getattr(self.fleets, name)[in_game].tolist()
+                for name in FleetArrays.columns
+            )
+        ):
+            fleet_id, player_id, ships, source, destination, total, remaining = values
+            fleet = object.__new__(FleetSnapshot)
+            fleet.__dict__.update(
+                ships=ships,
+                player_id=player_id,
+                source_planet=loaded_state.planets[source].planet_id,
+                destination_planet=loaded_state.planets[destination].planet_id,
+                total_trip_length=total,
+                turns_remaining=remaining,
+                fleet_id=fleet_id,
+            )
+            fleets.append(fleet)
+
+        state = GameState()
+        for planet in planets:
+            state.add_planet(planet)
+        for fleet in fleets:
+            state.add_fleet(fleet)
+        state.fleets = list(state.fleets)
+        state.trip_lengths = loaded_state.trip_lengths
+        state.next_fleet_id = int(self.next_fleet_id[game])
+        state.current_player = current_player
+        state.enemy_player = 2 if current_player == 1 else 1
+        return state
+
+    def get_bot_commands(self):
+        # Asks each running game's bots for their commands, as turn_step would
+        commands = []
+        for game, get_commands in enumerate(self.get_commands):
+            if self.done[game] or get_commands is None:
+                commands.append(([], []))
+                continue
+            get_bot_1_commands, get_bot_2_commands = get_commands
+            commands.append(
+                (
+                    get_bot_1_commands(self.get_game_state(game, 1)),
+                    get_bot_2_commands(self.get_game_state(game, 2)),
+                )
+            )
+        return commands
+
+    def step(self, commands: list = None):
+        # commands holds one (player 1 commands, player 2 commands) pair per
+        # game, and defaults to asking the games' bots. Returns a GameResult
+        # for every game that finished on this step (None for the rest) and
+        # the done flags of all games. Finished games stay frozen until reset
+        if commands is None:
+            commands = self.get_bot_commands()
+
+        running = ~self.done
+        self.turn_count += running
+
+        for game, game_commands in enumerate(commands):
+            if not running[game]:
+                continue
+            for player_id, player_commands in zip((1, 2), game_commands):
+                if not player_commands:
+                    continue
+                if not isinstance(player_commands, list):
+                    player_commands = [player_commands]
+                for command in player_commands:
+                    self.process_command(game, command, player_id)
+
+        self.move_fleets(running)
+        self.ships += self.growth * ((self.owner != 0) & running[:, None])
+        return self.check_results(running)
+
+    def process_command(self, game: int, command: FleetCommand, player_id: int):
+        # Same checks as GameController.process_command, but invalid commands
+        # are counted per game and player instead of printed. Bots are asked
+        # every turn, so a SleepHint is simply ignored
+        if isinstance(command, SleepHint):
+            return
+        if not isinstance(command, FleetCommand):
+            self.invalid_commands[game, player_id] += 1
+            return
+
+        planet_positions = self.loaded_states[game].planet_positions
+        source = planet_positions.get(command.source_planet)
+        destination = planet_positions.get(command.destination_planet)
+        ships = int(command.ships)
+
+        if (
+            source is None
+            or ships <= 0
+            or ships > self.ships[game, source]
+            or destination is None
+            or self.owner[game, source] != player_id
+            or source == destination
+        ):
+            self.invalid_commands[game, player_id] += 1
+            return
+
+        self.ships[game, source] -= ships
+        self.fleets.append(
+            self.next_fleet_id[game],
+            player_id,
+            ships,
+            source,
+            destination,
+            self.trip_lengths[game, source, destination],
+            game,
+        )
+        self.next_fleet_id[game] += 1
+
+    def move_fleets(self, running):
+        fleets = self.fleets
+        if not fleets.count:
+            return
+
+        games = fleets.game[: fleets.count]
+        moving = running[games]
+        turns_remaining = fleets.turns_remaining[: fleets.count]
+        turns_remaining -= moving
+        arrived = moving & (turns_remaining <= 0)
+        if not arrived.any():
+            return
+
+        arrivals = np.flatnonzero(arrived)
+        resolve_landings(
+            self.owner.reshape(-1),
+            self.ships.reshape(-1),
+            games[arrivals] * self.owner.shape[1] + fleets.destination[arrivals],
+            fleets.player_id[arrivals],
+            fleets.ships[arrivals],
+        )
+        fleets.keep(~arrived)
+
+    def check_results(self, running):
+        totals = self.get_player_totals()
+        player_1_ships, player_2_ships = totals[:, 1], totals[:, 2]
+        finished = running & (
+            (player_1_ships == 0)
+            | (player_2_ships == 0)
+            | (self.turn_count >= self.turn_limit)
+        )
+        self.winning_player = np.where(
+            finished,
+            np.where(
+                player_1_ships > player_2_ships,
+                1,
+                np.where(player_2_ships > player_1_ships, 2, 0),
+            ),
+            self.winning_player,
+        )
+        self.done |= finished
+
+        results = [None] * len(self)
+        for game in np.flatnonzero(finished).tolist():
+            map_file, bot_1, bot_2 = self.games[game]
+            results[game] = GameResult(
+                map_file,
+                bot_1,
+                bot_2,
+                int(self.winning_player[game]),
+                int(self.turn_count[game]),
+            )
+        return results, self.done.copy()